@@ -1,9 +1,54 @@
-import threading, requests, json, os, hashlib, time
-from concurrent.futures import ThreadPoolExecutor
-from flask import Flask, render_template_string, jsonify, Response, request, session, redirect, url_for
+import threading, requests, json, os, re, sys, hashlib, hmac, time, gzip, sqlite3, mmap, atexit, random, contextvars
+import cProfile, pstats, marshal, io, weakref
+from bisect import bisect_left
+from itertools import islice
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from requests.adapters import HTTPAdapter
+from flask import Flask, render_template_string, jsonify, Response, request, session, redirect, url_for, g
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import HTTPException
 from functools import wraps
 
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson when installed, else the stdlib encoder; both understand Video.
+class FastJSONProvider(DefaultJSONProvider):
+    @staticmethod
+    def default(o):
+        if isinstance(o, Video):
+            return o.to_dict()
+        return DefaultJSONProvider.default(o)
+
+    def dumps(self, obj, **kwargs):
+        return self.dumps_bytes(obj, kwargs.get('indent')).decode()
+
+    def dumps_bytes(self, obj, indent=None):
+        if orjson is not None:
+            return orjson.dumps(obj, default=self.default, option=orjson.OPT_INDENT_2 if indent else 0)
+        return json.dumps(obj, default=self.default, ensure_ascii=False, indent=indent,
+                          separators=None if indent else (',', ':')).encode()
+
+    def response(self, *args, **kwargs):
+        with phase('serialize'):
+            return super().response(*args, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
 app = Flask(__name__)
+app.json = FastJSONProvider(app)
 app.secret_key = os.environ.get('SECRET_KEY', 'velvet_secret_key_2024_xK9mP3qR')
 
 # --- CONFIGURATION ---
@@ -12,16 +57,681 @@ HEADERS = {
     'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
 }
 
-# In-memory user store (use a real DB in production)
-users_db = {}
-favorites_db = {}  # username -> list of video dicts
-history_db = {}    # username -> list of video dicts
+# Category bar and sort buttons, in display order; the warmer keeps page 1 of
+# every combination hot.
+CATEGORIES = [
+    ('korean', 'Korean'),
+    ('japanese', 'Japanese'),
+    ('amateur', 'Amateur'),
+    ('hentai', 'Hentai'),
+    ('milf', 'MILF'),
+    ('asian', 'Asian'),
+    ('vr', 'VR'),
+    ('blonde', 'Blonde'),
+    ('latina', 'Latina'),
+    ('pov', 'POV'),
+    ('teen', 'Teen 18+'),
+    ('threesome', 'Threesome'),
+    ('lesbian', 'Lesbian'),
+    ('bdsm', 'BDSM'),
+    ('creampie', 'Creampie'),
+    ('step sister nun strapon', 'The Nun'),
+    ('Adriana chechik', 'Adriana'),
+    ('step brother', 'Step Bro'),
+    ('Vina sky', 'Vina Sky'),
+    ('Aria alexander', 'Aria Alexander'),
+    ('Melayu gangbang', 'Melayu'),
+    ('Kitty meana wolf', 'Meana Wolf'),
+    ('mom son taboo', 'Mom'),
+    ('Nurul', 'Nurul'),
+    ('Kurashina kana', 'Kana'),
+    ('korean movie', 'Korean Movie'),
+    ('married couple', 'Married'),
+    ('british mom', 'British Mom'),
+    ('Ava adams', 'Ava Adams'),
+    ('gangbang', 'Gangbang'),
+    ('anal', 'Anal'),
+    ('squirt', 'Squirt'),
+    ('massage', 'Massage'),
+]
+SORT_ORDERS = [
+    ('latest', 'Latest'),
+    ('top-weekly', 'Hot'),
+    ('top-monthly', 'Monthly'),
+    ('top-rated', 'Top Rated'),
+    ('most-popular', 'Most Viewed'),
+]
+TRENDING = ('sex', 1, 'top-weekly', 12)
+
+# Upstream API client: pool size is per gunicorn worker process.
+UPSTREAM_URL = os.environ.get('UPSTREAM_URL', 'https://www.eporner.com/api/v2/video/search/')
+UPSTREAM_POOL_SIZE = int(os.environ.get('UPSTREAM_POOL_SIZE', 16))
+UPSTREAM_WORKERS = int(os.environ.get('UPSTREAM_WORKERS', 8))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 3))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get('UPSTREAM_READ_TIMEOUT', 6))
+
+# Every request gets REQUEST_DEADLINE seconds; upstream calls made for it are
+# capped at whatever is left. Background refreshes, prefetch and warming
+# aren't tied to a request and keep the plain timeouts.
+REQUEST_DEADLINE = float(os.environ.get('REQUEST_DEADLINE', 5))
+# Hedging: an upstream call still unanswered after the tracked p95 latency
+# (never less than UPSTREAM_HEDGE_MIN_DELAY) gets a duplicate, and whichever
+# answers first wins. At most UPSTREAM_HEDGE_MAX_RATE of calls are hedged.
+UPSTREAM_HEDGE = os.environ.get('UPSTREAM_HEDGE', '0') == '1'
+UPSTREAM_HEDGE_MIN_DELAY = float(os.environ.get('UPSTREAM_HEDGE_MIN_DELAY', 0.05))
+UPSTREAM_HEDGE_MAX_RATE = float(os.environ.get('UPSTREAM_HEDGE_MAX_RATE', 0.1))
+# Circuit breaker: UPSTREAM_BREAKER_FAILURES failed calls in a row stop all
+# upstream calls for UPSTREAM_BREAKER_COOLDOWN seconds, then one probe call
+# decides whether to resume. Cached and stale results are served meanwhile.
+UPSTREAM_BREAKER_FAILURES = int(os.environ.get('UPSTREAM_BREAKER_FAILURES', 5))
+UPSTREAM_BREAKER_COOLDOWN = float(os.environ.get('UPSTREAM_BREAKER_COOLDOWN', 10))
+# Adaptive (AIMD) limit on concurrent upstream calls, between 1 and
+# UPSTREAM_POOL_SIZE: it grows while calls answer within
+# UPSTREAM_LIMIT_LATENCY seconds and halves when they fail or are slower.
+# A call over the limit waits up to UPSTREAM_LIMIT_QUEUE_TIMEOUT for a slot.
+UPSTREAM_LIMIT_INITIAL = int(os.environ.get('UPSTREAM_LIMIT_INITIAL', 8))
+UPSTREAM_LIMIT_LATENCY = float(os.environ.get('UPSTREAM_LIMIT_LATENCY', 2))
+UPSTREAM_LIMIT_QUEUE_TIMEOUT = float(os.environ.get('UPSTREAM_LIMIT_QUEUE_TIMEOUT', 0.5))
+
+# Speculative fetch of the pages after the one /api/data just served. Skipped
+# while too many upstream calls are in flight or for a while after a failure.
+PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', '1') == '1'
+PREFETCH_DEPTH = int(os.environ.get('PREFETCH_DEPTH', 1))
+PREFETCH_WORKERS = int(os.environ.get('PREFETCH_WORKERS', 2))
+PREFETCH_MAX_PENDING = int(os.environ.get('PREFETCH_MAX_PENDING', 8))
+PREFETCH_MAX_UPSTREAM_INFLIGHT = int(os.environ.get('PREFETCH_MAX_UPSTREAM_INFLIGHT', 8))
+PREFETCH_BACKOFF = float(os.environ.get('PREFETCH_BACKOFF', 30))
+
+# Background cache warmer. WARM_SCOPE=host lets only the worker holding
+# WARM_LOCK_PATH warm; the default warms in every worker, and with the shared
+# cache each one takes pages another worker refreshed instead of refetching.
+WARM_ENABLED = os.environ.get('WARM_ENABLED', '1') == '1'
+WARM_INTERVAL = int(os.environ.get('WARM_INTERVAL', 60))
+WARM_WORKERS = int(os.environ.get('WARM_WORKERS', 4))
+WARM_SCOPE = os.environ.get('WARM_SCOPE', 'worker')
+WARM_LOCK_PATH = os.environ.get('WARM_LOCK_PATH', '/tmp/velvet-warmer.lock')
+
+# /api/data?pages=N fans out over the upstream executor; pages that miss the
+# deadline are dropped from the response but still land in the cache.
+MULTI_PAGE_MAX = int(os.environ.get('MULTI_PAGE_MAX', 5))
+MULTI_PAGE_DEADLINE = float(os.environ.get('MULTI_PAGE_DEADLINE', 4))
+
+# /api/batch runs GET sub-requests in-process; the ones that may hit upstream
+# run in parallel on their own pool.
+BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 8))
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 4))
+BATCH_PATHS = {'/api/me', '/api/favorites', '/api/history', '/api/is_favorite', '/api/data', '/api/trending', '/api/related'}
+BATCH_UPSTREAM_PATHS = {'/api/data', '/api/trending', '/api/related'}
+
+# Inline the session, trending strip and first feed pages into the index page
+# so the client can paint without any API calls. Only cached results are used.
+# Off by default: each / then builds and compresses the ~30 KB page per
+# request instead of serving the precompressed shell.
+INLINE_BOOTSTRAP = os.environ.get('INLINE_BOOTSTRAP', '0') == '1'
+BOOTSTRAP_FEED_PAGES = 2  # STREAM_PAGES in APP_JS
+
+# JSON responses at least COMPRESS_MIN_SIZE bytes are compressed to whatever
+# the client accepts. Cached results keep their serialized and compressed bytes.
+COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.environ.get('COMPRESS_BROTLI_QUALITY', 5))
+
+# Upstream result cache: seconds an entry is fresh per endpoint, then how long
+# past that it may still be served while a background refresh runs.
+CACHE_TTL = {
+    'data': int(os.environ.get('CACHE_TTL_DATA', 120)),
+    'trending': int(os.environ.get('CACHE_TTL_TRENDING', 300)),
+    'related': int(os.environ.get('CACHE_TTL_RELATED', 600)),
+}
+CACHE_STALE_TTL = int(os.environ.get('CACHE_STALE_TTL', 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 2000))
+CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Host-wide L2 behind each worker's cache: one SQLite file every worker reads
+# before going upstream. An empty path turns it off.
+CACHE_SHARED_PATH = os.environ.get('CACHE_SHARED_PATH', '/tmp/velvet-cache.db')
+CACHE_SHARED_MAX_ENTRIES = int(os.environ.get('CACHE_SHARED_MAX_ENTRIES', 20000))
+# Snapshot of the workers' caches: each merges its entries into the file
+# every CACHE_SNAPSHOT_INTERVAL seconds and at exit, and reads it back at
+# boot. An empty path turns it off.
+CACHE_SNAPSHOT_PATH = os.environ.get('CACHE_SNAPSHOT_PATH', '/tmp/velvet-cache.snapshot')
+CACHE_SNAPSHOT_INTERVAL = int(os.environ.get('CACHE_SNAPSHOT_INTERVAL', 300))
+
+# User store: 'sqlite' shares STORE_PATH between all workers and survives
+# restarts; 'memory' is per process and gone on exit
+STORE_BACKEND = os.environ.get('STORE_BACKEND', 'sqlite')
+STORE_PATH = os.environ.get('STORE_PATH', 'velvet.db')
+STORE_BUSY_TIMEOUT = float(os.environ.get('STORE_BUSY_TIMEOUT', 5))  # seconds to wait on a locked db
+HISTORY_MAX = int(os.environ.get('HISTORY_MAX', 100))  # plays kept per user
+FAVORITES_PAGE_MAX = 200  # also caps ids per bulk /api/is_favorite
+
+# Prometheus metrics: each worker writes its values under METRICS_DIR every
+# METRICS_FLUSH_INTERVAL seconds and /metrics adds up every worker's file.
+# An empty dir reports this process only. gunicorn.conf.py empties the dir
+# when the master starts.
+METRICS_DIR = os.environ.get('METRICS_DIR', '/tmp/velvet-metrics')
+METRICS_FLUSH_INTERVAL = int(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Per-request phase timings go out as a Server-Timing header. A JSON log line
+# with the request id is printed for TIMING_LOG_SAMPLE of requests (0-1) and
+# for every request slower than TIMING_LOG_SLOW_MS (0 turns that off).
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '1') == '1'
+TIMING_LOG_SAMPLE = float(os.environ.get('TIMING_LOG_SAMPLE', 0))
+TIMING_LOG_SLOW_MS = float(os.environ.get('TIMING_LOG_SLOW_MS', 0))
+
+# Opt-in profiling, per worker. PROFILE_SAMPLE_RATE=N runs 1 in N requests of
+# each route under cProfile; PROFILE_STACK_INTERVAL_MS samples the stacks of
+# threads serving requests. Both are read from /debug/profile, which only
+# exists when PROFILE_TOKEN is set.
+PROFILE_TOKEN = os.environ.get('PROFILE_TOKEN', '')
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_STACK_INTERVAL_MS = float(os.environ.get('PROFILE_STACK_INTERVAL_MS', 0))
+PROFILE_MAX_STACKS = 10000  # distinct stacks kept per route
+
+# --- METRICS ---
+# Counters and histograms live in plain dicts behind one lock, so recording
+# is a dict update. Gauges, and counters other objects already keep, are read
+# from collector callbacks only when a worker writes its file or answers a
+# scrape. Labels are tuples of (name, value) pairs.
+class Metrics:
+    def __init__(self, directory=METRICS_DIR):
+        self.directory = directory
+        self._meta = {}        # name -> (type, help)
+        self._buckets = {}     # histogram name -> upper bounds
+        self._counters = {}    # (name, labels) -> value
+        self._histograms = {}  # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self._collectors = []
+        self._lock = threading.Lock()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def counter(self, name, help):
+        self._meta[name] = ('counter', help)
+
+    def gauge(self, name, help):
+        self._meta[name] = ('gauge', help)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS):
+        self._meta[name] = ('histogram', help)
+        self._buckets[name] = buckets
+
+    # fn() yields (name, labels, value) for counters and gauges declared above.
+    def collector(self, fn):
+        self._collectors.append(fn)
+        return fn
+
+    def inc(self, name, labels=(), value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        bounds = self._buckets[name]
+        i = bisect_left(bounds, value)
+        key = (name, labels)
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = [0] * (len(bounds) + 2)
+            h[i] += 1
+            h[-1] += value
+
+    def state(self):
+        with self._lock:
+            counters = [[name, labels, v] for (name, labels), v in self._counters.items()]
+            histograms = [[name, labels, list(h)] for (name, labels), h in self._histograms.items()]
+        gauges = []
+        for fn in self._collectors:
+            for name, labels, v in fn():
+                (counters if self._meta[name][0] == 'counter' else gauges).append([name, labels, v])
+        return {"pid": os.getpid(), "counters": counters, "gauges": gauges, "histograms": histograms}
+
+    def flush(self):
+        if not self.directory:
+            return
+        path = os.path.join(self.directory, f'{os.getpid()}.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(self.state(), f)
+        os.replace(path + '.tmp', path)
+
+    def _states(self):
+        if not self.directory:
+            return [self.state()]
+        self.flush()
+        try:
+            self._retire_dead()
+        except (OSError, ValueError) as e:
+            print(f"Metrics retire error: {e}")
+        states = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    states.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return states
+
+    # Adds the counters and histograms of exited workers into retired.json
+    # and removes their files, so worker restarts don't grow the dir; their
+    # gauges are dropped. Readers take turns under a lock file so no file is
+    # folded in twice.
+    def _retire_dead(self):
+        import fcntl
+        with open(os.path.join(self.directory, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            dead = [name for name in os.listdir(self.directory)
+                    if name.endswith('.json') and name[:-5].isdigit() and not self._alive(int(name[:-5]))]
+            if not dead:
+                return
+            path = os.path.join(self.directory, 'retired.json')
+            try:
+                with open(path) as f:
+                    retired = json.load(f)
+            except FileNotFoundError:
+                retired = {"pid": 0, "counters": [], "gauges": [], "histograms": []}
+            counters = {(name, tuple(map(tuple, labels))): v for name, labels, v in retired['counters']}
+            histograms = {(name, tuple(map(tuple, labels))): h for name, labels, h in retired['histograms']}
+            for name in dead:
+                try:
+                    with open(os.path.join(self.directory, name)) as f:
+                        state = json.load(f)
+                except ValueError:  # cut off mid-write; nothing to keep
+                    continue
+                for name, labels, v in state['counters']:
+                    key = (name, tuple(map(tuple, labels)))
+                    counters[key] = counters.get(key, 0) + v
+                for name, labels, h in state['histograms']:
+                    key = (name, tuple(map(tuple, labels)))
+                    known = histograms.get(key)
+                    histograms[key] = h if known is None else [a + b for a, b in zip(known, h)]
+            retired['counters'] = [[name, labels, v] for (name, labels), v in counters.items()]
+            retired['histograms'] = [[name, labels, h] for (name, labels), h in histograms.items()]
+            with open(path + '.tmp', 'w') as f:
+                json.dump(retired, f)
+            os.replace(path + '.tmp', path)
+            for name in dead:
+                os.remove(os.path.join(self.directory, name))
+
+    @staticmethod
+    def _alive(pid):
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    # Prometheus text exposition of all workers' values added together.
+    def render(self):
+        totals = {}
+        histograms = {}
+        for state in self._states():
+            rows = state['counters'] + (state['gauges'] if self._alive(state['pid']) else [])
+            for name, labels, v in rows:
+                key = (name, tuple(map(tuple, labels)))
+                totals[key] = totals.get(key, 0) + v
+            for name, labels, h in state['histograms']:
+                key = (name, tuple(map(tuple, labels)))
+                known = histograms.get(key)
+                histograms[key] = h if known is None else [a + b for a, b in zip(known, h)]
+        by_name = {}  # name -> [(labels, lines)]
+        for (name, labels), v in totals.items():
+            by_name.setdefault(name, []).append((labels, [f'{name}{self._labels(labels)} {v:g}']))
+        for (name, labels), h in histograms.items():
+            lines = []
+            running = 0
+            for bound, count in zip(self._buckets[name] + (float('inf'),), h):
+                running += count
+                le = '+Inf' if bound == float('inf') else f'{bound:g}'
+                lines.append(f'{name}_bucket{self._labels(labels + (("le", le),))} {running}')
+            lines.append(f'{name}_sum{self._labels(labels)} {h[-1]:g}')
+            lines.append(f'{name}_count{self._labels(labels)} {running}')
+            by_name.setdefault(name, []).append((labels, lines))
+        out = []
+        for name in sorted(by_name):
+            kind, help = self._meta.get(name, ('untyped', ''))
+            out.append(f'# HELP {name} {help}')
+            out.append(f'# TYPE {name} {kind}')
+            for _, lines in sorted(by_name[name]):
+                out.extend(lines)
+        return '\n'.join(out) + '\n'
+
+    @staticmethod
+    def _labels(labels):
+        if not labels:
+            return ''
+        escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in labels)
+        return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + '}'
+
+metrics = Metrics()
+metrics.counter('velvet_http_requests_total', 'HTTP requests by route, method and status.')
+metrics.histogram('velvet_http_request_duration_seconds', 'Time to build the response, by route.')
+metrics.gauge('velvet_http_requests_in_flight', 'Requests being handled.')
+metrics.counter('velvet_upstream_requests_total', 'Upstream search calls by order and outcome (HTTP status, timeout or error).')
+metrics.histogram('velvet_upstream_request_duration_seconds', 'Upstream search latency by order.')
+metrics.gauge('velvet_upstream_in_flight', 'Upstream search calls in progress.')
+metrics.counter('velvet_format_errors_total', 'Upstream videos that failed to format.')
+metrics.counter('velvet_cache_lookups_total', 'Response cache lookups by tier and result.')
+metrics.counter('velvet_cache_stale_errors_total', 'Upstream failures answered from an expired cache entry.')
+metrics.gauge('velvet_cache_entries', 'Entries in the in-process response cache.')
+metrics.gauge('velvet_cache_bytes', 'Serialized size of the in-process response cache.')
+metrics.counter('velvet_upstream_collapsed_total', 'Upstream calls that joined one already in flight.')
+metrics.counter('velvet_prefetch_total', 'Prefetch decisions by result.')
+metrics.gauge('velvet_executor_queue_depth', 'Tasks waiting for a thread, by pool.')
+metrics.counter('velvet_upstream_hedges_total', 'Hedged upstream calls: fired, and won by the duplicate.')
+metrics.gauge('velvet_upstream_breaker_state', 'Workers whose upstream circuit breaker is in each state.')
+metrics.counter('velvet_upstream_breaker_opened_total', 'Times the upstream circuit breaker opened.')
+metrics.counter('velvet_upstream_rejected_total', 'Upstream calls refused locally, by reason.')
+metrics.gauge('velvet_upstream_concurrency_limit', 'Current adaptive limit on concurrent upstream calls.')
+
+# Client-chosen orders are folded into 'other' to keep label values bounded.
+UPSTREAM_ORDERS = {order for order, _ in SORT_ORDERS}
+
+# (phase, seconds) spans of the current request; None outside one. Work
+# handed to a pool through submit_in_context keeps reporting into it.
+request_spans = contextvars.ContextVar('request_spans', default=None)
+
+@contextmanager
+def phase(name):
+    spans = request_spans.get()
+    if spans is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans.append((name, time.perf_counter() - start))
+
+def submit_in_context(executor, fn, *args):
+    return executor.submit(contextvars.copy_context().run, fn, *args)
+
+# time.monotonic() by which the current request must answer, or None.
+request_deadline = contextvars.ContextVar('request_deadline', default=None)
+
+def time_left():
+    deadline = request_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+# --- PROFILING ---
+# Per-route cProfile stats and wall-clock stack samples. Only one request is
+# under cProfile at a time (newer Pythons allow a single active profiler), so
+# a sampled request that finds it busy just runs unprofiled. The stack
+# sampler thread reads sys._current_frames() for the threads registered as
+# serving a route and counts their collapsed stacks, flamegraph-ready.
+class Profiler:
+    def __init__(self, sample_rate=PROFILE_SAMPLE_RATE, stack_interval_ms=PROFILE_STACK_INTERVAL_MS):
+        self.sample_rate = sample_rate
+        self.stack_interval = stack_interval_ms / 1000
+        self.profiled = self.busy = self.stack_samples = 0
+        self._seen = {}    # route -> requests so far
+        self._stats = {}   # route -> pstats.Stats
+        self._stacks = {}  # route -> {collapsed stack: samples}
+        self._active = {}  # thread id -> route being served
+        self._busy = threading.Lock()
+        self._owner = None  # the profile holding _busy
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self.stack_interval and self._thread is None:
+            self._thread = threading.Thread(target=self._sample_loop, name='stack-sampler', daemon=True)
+            self._thread.start()
+
+    # Returns the profile to hand back to end(), or None.
+    def begin(self, route):
+        if route == '/debug/profile':
+            return None
+        if self.stack_interval:
+            self._active[threading.get_ident()] = route
+        if not self.sample_rate:
+            return None
+        seen = self._seen[route] = self._seen.get(route, 0) + 1
+        if seen % self.sample_rate:
+            return None
+        if not self._busy.acquire(blocking=False):
+            self.busy += 1
+            return None
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:  # some other profiler is active
+            self._busy.release()
+            return None
+        self._owner = prof
+        return prof
+
+    # Safe to call twice: only the profile holding the slot releases it.
+    def end(self, route, prof):
+        self._active.pop(threading.get_ident(), None)
+        if prof is None or prof is not self._owner:
+            return
+        self._owner = None
+        prof.disable()
+        self._busy.release()
+        with self._lock:
+            stats = self._stats.get(route)
+            if stats is None:
+                self._stats[route] = pstats.Stats(prof)
+            else:
+                stats.add(prof)
+            self.profiled += 1
+
+    def _sample_loop(self):
+        while True:
+            time.sleep(self.stack_interval)
+            frames = sys._current_frames()
+            for ident, route in list(self._active.items()):
+                frame = frames.get(ident)
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                if not stack:
+                    continue
+                key = ';'.join(reversed(stack))
+                with self._lock:
+                    counts = self._stacks.setdefault(route, {})
+                    if key in counts or len(counts) < PROFILE_MAX_STACKS:
+                        counts[key] = counts.get(key, 0) + 1
+                        self.stack_samples += 1
+
+    def routes(self):
+        with self._lock:
+            return {"pid": os.getpid(), "profiled": self.profiled, "busy": self.busy,
+                    "stack_samples": self.stack_samples,
+                    "cprofile": sorted(self._stats), "stacks": sorted(self._stacks)}
+
+    # cProfile stats for route (all routes when None), as a pstats.Stats or None.
+    def stats(self, route=None):
+        with self._lock:
+            picked = [s for r, s in self._stats.items() if route is None or r == route]
+            if not picked:
+                return None
+            merged = pstats.Stats()
+            for s in picked:
+                merged.add(s)
+        return merged
+
+    # One "route;frame;frame count" line per distinct stack, root first.
+    def collapsed(self, route=None):
+        with self._lock:
+            return ''.join(f'{r};{stack} {n}\n' for r, counts in self._stacks.items()
+                           if route is None or r == route for stack, n in counts.items())
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._stacks.clear()
+            self.profiled = self.busy = self.stack_samples = 0
+
+profiler = Profiler()
 
 # --- BACKEND ---
-def fetch_single_page(query, page_num, order='latest', per_page=24):
-    try:
+class UpstreamError(Exception):
+    pass
+
+# Refused before reaching upstream: breaker open or no concurrency slot.
+class UpstreamUnavailable(UpstreamError):
+    pass
+
+# Closed: calls go through and failures in a row are counted; `failures` of
+# them open the breaker. Open: calls are refused for `cooldown` seconds.
+# Half-open: one probe at a time goes through; success closes the breaker,
+# failure opens it again.
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+    def __init__(self, failures=UPSTREAM_BREAKER_FAILURES, cooldown=UPSTREAM_BREAKER_COOLDOWN):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.opened = self.rejected = 0
+        self._in_a_row = 0
+        self._open_until = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def closed(self):
+        return self.state == self.CLOSED
+
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN:
+                if time.monotonic() < self._open_until:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+            if self._probing:
+                self.rejected += 1
+                return False
+            self._probing = True
+            return True
+
+    # An allowed call that never reached upstream.
+    def abort(self):
+        with self._lock:
+            self._probing = False
+
+    def success(self):
+        with self._lock:
+            self._in_a_row = 0
+            self._probing = False
+            self.state = self.CLOSED
+
+    def failure(self):
+        with self._lock:
+            self._in_a_row += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or (self.state == self.CLOSED and self._in_a_row >= self.failures):
+                self.state = self.OPEN
+                self._open_until = time.monotonic() + self.cooldown
+                self.opened += 1
+                print(f"Upstream circuit open for {self.cooldown:g}s after {self._in_a_row} failures")
+
+# Additive increase, multiplicative decrease: every call that succeeds within
+# `latency` seconds adds 1/limit (about +1 per limit calls); a failure or a
+# slower answer halves the limit, at most once per `latency` seconds so a
+# burst of slow calls only counts once.
+class AIMDLimiter:
+    def __init__(self, initial=UPSTREAM_LIMIT_INITIAL, minimum=1, maximum=UPSTREAM_POOL_SIZE,
+                 latency=UPSTREAM_LIMIT_LATENCY):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency = latency
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.inflight = self.rejected = 0
+        self._last_decrease = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, timeout):
+        with self._cond:
+            if not self._cond.wait_for(lambda: self.inflight < int(self.limit), timeout):
+                self.rejected += 1
+                return False
+            self.inflight += 1
+            return True
+
+    # ok=None: the call says nothing about upstream and the limit stays put.
+    def release(self, elapsed, ok):
+        with self._cond:
+            self.inflight -= 1
+            if ok is None:
+                pass
+            elif ok and elapsed <= self.latency:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            else:
+                now = time.monotonic()
+                if now - self._last_decrease >= self.latency:
+                    self.limit = max(self.minimum, self.limit / 2)
+                    self._last_decrease = now
+            self._cond.notify()
+
+# Rolling p95 of the last `window` upstream latencies, recomputed every 16
+# samples. None until there are enough to mean anything.
+class LatencyTracker:
+    def __init__(self, window=200, min_samples=20):
+        self.min_samples = min_samples
+        self._samples = deque(maxlen=window)
+        self._count = 0
+        self._p95 = None
+
+    def record(self, seconds):
+        self._samples.append(seconds)
+        self._count += 1
+        if len(self._samples) >= self.min_samples and (self._p95 is None or self._count % 16 == 0):
+            ordered = sorted(self._samples)
+            self._p95 = ordered[int(len(ordered) * 0.95)]
+
+    def p95(self):
+        return self._p95
+
+# Sessions aren't safe to share between threads but urllib3's pool is, so every
+# thread gets its own Session mounted on one shared keep-alive adapter.
+# Hedged calls run their attempts on a separate pool so a search made from
+# an upstream executor thread can't wait on a slot in its own pool.
+class UpstreamClient:
+    def __init__(self, base_url=UPSTREAM_URL, pool_size=UPSTREAM_POOL_SIZE, workers=UPSTREAM_WORKERS,
+                 connect_timeout=UPSTREAM_CONNECT_TIMEOUT, read_timeout=UPSTREAM_READ_TIMEOUT,
+                 hedge=UPSTREAM_HEDGE, hedge_min_delay=UPSTREAM_HEDGE_MIN_DELAY, hedge_max_rate=UPSTREAM_HEDGE_MAX_RATE,
+                 breaker=None, limiter=None):
+        self.base_url = base_url
+        self.timeout = (connect_timeout, read_timeout)
+        self.adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=0)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='upstream')
+        self.inflight = 0
+        self.hedge = hedge
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_max_rate = hedge_max_rate
+        self.latency = LatencyTracker()
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AIMDLimiter(maximum=pool_size)
+        self.calls = self.hedged = self.hedge_wins = 0
+        self._hedge_executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='hedge') if hedge else None
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @property
+    def session(self):
+        s = getattr(self._local, 'session', None)
+        if s is None:
+            s = requests.Session()
+            s.headers.update(HEADERS)
+            s.mount('https://', self.adapter)
+            s.mount('http://', self.adapter)
+            self._local.session = s
+        return s
+
+    def search(self, query, page_num, order='latest', per_page=24):
         url = (
-            f'https://www.eporner.com/api/v2/video/search/'
+            f'{self.base_url}'
             f'?query={requests.utils.quote(query)}'
             f'&per_page={per_page}'
             f'&page={page_num}'
@@ -29,82 +739,1553 @@ def fetch_single_page(query, page_num, order='latest', per_page=24):
             f'&format=json'
             f'&thumbsize=big'
         )
-        r = requests.get(url, headers=HEADERS, timeout=6)
-        if r.status_code == 200:
+        self.calls += 1
+        if self.hedge:
+            data = self._hedged(url, order)
+        else:
+            data = self._attempt(url, order)
+        return data.get('videos', []), data.get('total_count', 0)
+
+    def _attempt(self, url, order):
+        labels = (('order', order if order in UPSTREAM_ORDERS else 'other'),)
+        left = time_left()
+        if left is not None and left <= 0:
+            metrics.inc('velvet_upstream_requests_total', labels + (('status', 'deadline'),))
+            raise UpstreamError("Deadline exceeded")
+        timeout = self.timeout if left is None else (min(self.timeout[0], left), min(self.timeout[1], left))
+        if not self.breaker.allow():
+            raise UpstreamUnavailable("Upstream circuit open")
+        if not self.limiter.acquire(UPSTREAM_LIMIT_QUEUE_TIMEOUT if left is None else min(left, UPSTREAM_LIMIT_QUEUE_TIMEOUT)):
+            self.breaker.abort()
+            raise UpstreamUnavailable("Upstream concurrency limit reached")
+        with self._lock:
+            self.inflight += 1
+        start = time.perf_counter()
+        status = 'error'
+        try:
+            r = self.session.get(url, timeout=timeout)
+            status = str(r.status_code)
+            if r.status_code != 200:
+                raise UpstreamError(f"HTTP {r.status_code}")
             data = r.json()
-            return data.get('videos', []), data.get('total_count', 0)
-    except Exception as e:
-        print(f"Fetch error: {e}")
-    return [], 0
+        except Exception as e:
+            if isinstance(e, requests.Timeout):
+                status = 'timeout'
+            print(f"Fetch error: {e}")
+            raise UpstreamError(str(e)) from e
+        finally:
+            with self._lock:
+                self.inflight -= 1
+            elapsed = time.perf_counter() - start
+            # Other 4xx answers are about the request, not upstream health,
+            # and so is a timeout when the caller's deadline left less time
+            # than upstream usually needs (its p95, at most
+            # UPSTREAM_LIMIT_LATENCY). A longer wait counts as a failure.
+            usual = min(self.latency.p95() or self.limiter.latency, self.limiter.latency)
+            if status == 'timeout' and left is not None and left < usual:
+                healthy = None
+                self.breaker.abort()
+            else:
+                healthy = status == '200' or (status[0] == '4' and status != '429')
+                if healthy:
+                    self.breaker.success()
+                else:
+                    self.breaker.failure()
+            self.limiter.release(elapsed, healthy)
+            metrics.observe('velvet_upstream_request_duration_seconds', labels, elapsed)
+            metrics.inc('velvet_upstream_requests_total', labels + (('status', status),))
+        self.latency.record(elapsed)
+        return data
+
+    def _hedged(self, url, order):
+        first = submit_in_context(self._hedge_executor, self._attempt, url, order)
+        delay = max(self.hedge_min_delay, self.latency.p95() or 0)
+        left = time_left()
+        try:
+            return first.result(timeout=delay if left is None else max(0, min(delay, left)))
+        except TimeoutError:
+            pass
+        pending = {first}
+        if self.hedged < self.hedge_max_rate * self.calls and (left is None or left > delay):
+            self.hedged += 1
+            pending.add(submit_in_context(self._hedge_executor, self._attempt, url, order))
+        error = None
+        while pending:
+            left = time_left()
+            done, pending = wait(pending, timeout=None if left is None else max(0, left), return_when=FIRST_COMPLETED)
+            if not done:
+                raise UpstreamError("Deadline exceeded")
+            for f in done:
+                if f.exception() is None:
+                    if f is not first:
+                        self.hedge_wins += 1
+                    return f.result()
+                error = f.exception()
+        raise error
+
+upstream = UpstreamClient()
 
-def format_video(v):
-    try:
-        thumbs = v.get('thumbs', [])
-        poster = thumbs[4]['src'] if len(thumbs) > 4 else v.get('default_thumb', {}).get('src', '')
-        big_thumb = thumbs[-1]['src'] if thumbs else poster
-        
+def fetch_single_page(query, page_num, order='latest', per_page=24):
+    return upstream.search(query, page_num, order, per_page)
+
+VIDEO_FIELDS = ('id', 'title', 'poster', 'big_thumb', 'rating', 'views', 'categories',
+                'duration', 'embed_url', 'video_url', 'added', 'is_vr')
+
+# Formatted video. Slots instead of a 12-key dict per video; v['field'] still
+# works for code that treats it as a dict.
+class Video:
+    __slots__ = VIDEO_FIELDS + ('__weakref__',)
+
+    def __init__(self, id='', title='Untitled', poster='', big_thumb='', rating=0, views=0, categories=(),
+                 duration='0', embed_url='', video_url='', added='', is_vr=False):
+        self.id = id
+        self.title = title
+        self.poster = poster
+        self.big_thumb = big_thumb
+        self.rating = rating
+        self.views = views
+        self.categories = categories
+        self.duration = duration
+        self.embed_url = embed_url
+        self.video_url = video_url
+        self.added = added
+        self.is_vr = is_vr
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
         return {
-            "id": v.get('id', ''),
-            "title": v.get('title', 'Untitled'),
-            "poster": poster,
-            "big_thumb": big_thumb,
-            "rating": round(float(v.get('rate', 0)), 1),
-            "views": v.get('views', 0),
-            "categories": [k.strip() for k in v.get('keywords', '').split(',')][:4],
-            "duration": v.get('length_min', '0'),
-            "embed_url": v.get('embed', ''),
-            "video_url": v.get('url', ''),
-            "added": v.get('added', ''),
-            "is_vr": v.get('is_vr', False)
+            "id": self.id,
+            "title": self.title,
+            "poster": self.poster,
+            "big_thumb": self.big_thumb,
+            "rating": self.rating,
+            "views": self.views,
+            "categories": self.categories,
+            "duration": self.duration,
+            "embed_url": self.embed_url,
+            "video_url": self.video_url,
+            "added": self.added,
+            "is_vr": self.is_vr
         }
-    except Exception as e:
-        print(f"Format error: {e}")
-        return None
 
-def load_content(query="korean", page=1, order='latest', per_page=24):
-    videos, total = fetch_single_page(query, page, order, per_page)
+    @classmethod
+    def from_dict(cls, d):
+        return cls(**{k: d[k] for k in VIDEO_FIELDS if k in d})
+
+    # A video as sent by a client (favorite/history POST bodies), or None if
+    # its id is unusable. The frontend puts several fields into markup
+    # unescaped, so each field is coerced to its type and anything that is
+    # not a plain id, an https URL or a duration falls back to the default.
+    @classmethod
+    def from_client(cls, d):
+        if not isinstance(d, dict) or not isinstance(d.get('id'), str) or not _CLIENT_ID.match(d['id']):
+            return None
+
+        def text(key, default=''):
+            value = d.get(key)
+            return value[:300] if isinstance(value, str) else default
+
+        def url(key):
+            value = text(key)
+            return value if _CLIENT_URL.match(value) else ''
+
+        def number(key, kind):
+            try:
+                return kind(d.get(key) or 0)
+            except (TypeError, ValueError, OverflowError):
+                return 0
+
+        categories = d.get('categories')
+        duration = str(d.get('duration', ''))
+        return cls(d['id'], text('title', 'Untitled'), url('poster'), url('big_thumb'),
+                   number('rating', float), number('views', int),
+                   tuple([c[:100] for c in categories[:4] if isinstance(c, str)]) if isinstance(categories, list) else (),
+                   duration if _CLIENT_DURATION.match(duration) else '0',
+                   url('embed_url'), url('video_url'), text('added')[:32], d.get('is_vr') is True)
+
+_CLIENT_ID = re.compile(r'[A-Za-z0-9_-]{1,64}\Z')
+_CLIENT_URL = re.compile(r'https://[^\s"\'<>`\\]+\Z')
+_CLIENT_DURATION = re.compile(r'[0-9][0-9:.]{0,15}\Z')
+
+# Formats one upstream page, dropping videos without an embed URL.
+def format_page(videos):
     result = []
+    append = result.append
     for v in videos:
-        fmt = format_video(v)
-        if fmt and fmt['embed_url']:
-            result.append(fmt)
+        try:
+            embed = v.get('embed', '')
+            if not embed:
+                continue
+            thumbs = v.get('thumbs') or ()
+            poster = thumbs[4]['src'] if len(thumbs) > 4 else v.get('default_thumb', {}).get('src', '')
+            append(Video(
+                v.get('id', ''),
+                v.get('title', 'Untitled'),
+                poster,
+                thumbs[-1]['src'] if thumbs else poster,
+                round(float(v.get('rate', 0)), 1),
+                v.get('views', 0),
+                # Only the first four keywords are shown; don't split the rest
+                tuple([k.strip() for k in v.get('keywords', '').split(',', 4)[:4]]),
+                v.get('length_min', '0'),
+                embed,
+                v.get('url', ''),
+                v.get('added', ''),
+                v.get('is_vr', False)
+            ))
+        except Exception as e:
+            metrics.inc('velvet_format_errors_total')
+            print(f"Format error: {e}")
+    return result
+
+def format_video(v):
+    page = format_page([v])
+    return page[0] if page else None
+
+# --- CACHE ---
+# value is a (videos, total) page; raw is the videos list pre-serialized once
+# so responses can splice it instead of re-encoding. size counts raw plus the
+# encoded response bodies; held is whether a ResponseCache counts it now.
+class CacheEntry:
+    __slots__ = ('value', 'raw', 'size', 'etag', 'expires', 'stale_until', 'encoded', 'held')
+
+    def __init__(self, value, raw, etag, expires, stale_until):
+        self.value = value
+        self.raw = raw
+        self.size = len(raw)
+        self.etag = etag
+        self.expires = expires
+        self.stale_until = stale_until
+        self.encoded = {}  # variant or (variant, encoding) -> response bytes
+        self.held = False
+
+# One sqlite connection per thread, reopened in a forked child.
+class ThreadConnections:
+    def __init__(self, path, busy_timeout):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+
+    def connect(self):
+        db = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None, check_same_thread=False)
+        db.execute('PRAGMA synchronous=NORMAL')
+        return db
+
+    def get(self):
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = self.connect()
+            local.pid = os.getpid()
+        return local.db
+
+# L2 for ResponseCache shared by every worker on the host: the serialized
+# videos of each result in an SQLite WAL file, with wall-clock expiry so
+# workers agree on freshness. Each put is a single atomic upsert. Errors
+# count as misses; the L1 and upstream still work without it.
+class SharedCache:
+    def __init__(self, path=CACHE_SHARED_PATH, max_entries=CACHE_SHARED_MAX_ENTRIES, busy_timeout=1):
+        self.max_entries = max_entries
+        self.hits = self.misses = self.stale_hits = self.errors = 0
+        self._conns = ThreadConnections(path, busy_timeout)
+        self._puts = 0
+        db = self._conns.connect()
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, raw BLOB NOT NULL, '
+                       'total INTEGER NOT NULL, etag TEXT NOT NULL, expires REAL NOT NULL, stale_until REAL NOT NULL)')
+            db.execute('CREATE INDEX IF NOT EXISTS entries_by_stale_until ON entries (stale_until)')
+        finally:
+            db.close()
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(key)
+
+    # Returns (raw, total, etag, fresh_for, stale_for) in seconds from now,
+    # or None when missing or past stale_until.
+    def get(self, key):
+        try:
+            row = self._conns.get().execute('SELECT raw, total, etag, expires, stale_until FROM entries WHERE key = ?',
+                                            (self._key(key),)).fetchone()
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Shared cache error: {e}")
+            return None
+        now = time.time()
+        if row is None or row[4] <= now:
+            self.misses += 1
+            return None
+        if row[3] > now:
+            self.hits += 1
+        else:
+            self.stale_hits += 1
+        return row[0], row[1], row[2], row[3] - now, row[4] - now
+
+    def put(self, key, entry, ttl, stale_ttl):
+        now = time.time()
+        try:
+            db = self._conns.get()
+            db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)',
+                       (self._key(key), entry.raw, entry.value[1], entry.etag, now + ttl, now + ttl + stale_ttl))
+            self._puts += 1
+            if self._puts % 100 == 0:
+                self._prune(db, now)
+        except sqlite3.Error as e:
+            self.errors += 1
+            print(f"Shared cache error: {e}")
+
+    def _prune(self, db, now):
+        db.execute('DELETE FROM entries WHERE stale_until <= ?', (now,))
+        db.execute('DELETE FROM entries WHERE key IN (SELECT key FROM entries ORDER BY stale_until DESC '
+                   'LIMIT -1 OFFSET ?)', (self.max_entries,))
+
+# Cache contents saved to disk so a restarted worker starts warm. The file is
+# a JSON index (key, offset, length, total, etag and wall-clock expiry per
+# entry) followed by each entry's serialized videos. Loading only maps the
+# file and parses the index; an entry is decoded when it is first asked for,
+# and entries past stale_until are dropped.
+class CacheSnapshot:
+    MAGIC = b'VSNAP1'
+
+    def __init__(self, index=None, buf=None, base=0):
+        self.loaded = len(index or ())
+        self.used = 0
+        self._index = index or {}
+        self._buf = buf
+        self._base = base
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._index)
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, 'rb') as f:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # missing or empty
+            return cls()
+        try:
+            if buf[:6] != cls.MAGIC:
+                raise ValueError('not a cache snapshot')
+            size = int.from_bytes(buf[6:14], 'big')
+            now = time.time()
+            index = {tuple(key): meta for key, *meta in json.loads(buf[14:14 + size]) if meta[5] > now}
+        except ValueError as e:
+            print(f"Snapshot load error: {e}")
+            buf.close()
+            return cls()
+        return cls(index, buf, 14 + size)
+
+    # Same shape as SharedCache.get; each entry is handed out once.
+    def take(self, key):
+        if not self._index:
+            return None
+        with self._lock:
+            meta = self._index.pop(key, None)
+            if meta is None:
+                return None
+            offset, length, total, etag, expires, stale_until = meta
+            raw = self._raw(offset, length)
+            if not self._index:
+                self._buf.close()
+        now = time.time()
+        if stale_until <= now:
+            return None
+        self.used += 1
+        return raw, total, etag, expires - now, stale_until - now
+
+    def _raw(self, start, length):
+        return self._buf[self._base + start:self._base + start + length]
+
+    # Merges entries ((key, CacheEntry) pairs) into the snapshot at path,
+    # together with whatever was loaded here but never taken, atomically
+    # replacing it. Every worker saves to the same file, so saves take turns
+    # under a lock file and the copy of a key that stays fresh longest wins.
+    def save(self, path, entries):
+        import fcntl
+        now = time.time()
+        wall = now - time.monotonic()
+        best = {}  # key -> (expires, stale_until, total, etag, raw or its (start, length) on disk)
+
+        def offer(key, expires, stale_until, total, etag, raw):
+            if stale_until > now and (key not in best or expires > best[key][0]):
+                best[key] = (expires, stale_until, total, etag, raw)
+
+        for key, entry in entries:
+            offer(key, wall + entry.expires, wall + entry.stale_until, entry.value[1], entry.etag, entry.raw)
+        with open(f'{path}.lock', 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            on_disk = CacheSnapshot.load(path)
+            try:
+                for key, (start, length, total, etag, expires, stale_until) in on_disk._index.items():
+                    offer(key, expires, stale_until, total, etag, (start, length))
+                # take() closes our map once it is used up, so copy under its lock
+                with self._lock:
+                    for key, (start, length, total, etag, expires, stale_until) in self._index.items():
+                        if key not in best or expires > best[key][0]:
+                            offer(key, expires, stale_until, total, etag, self._raw(start, length))
+                index, chunks, offset = [], [], 0
+                for key, (expires, stale_until, total, etag, raw) in best.items():
+                    if isinstance(raw, tuple):
+                        raw = on_disk._raw(*raw)
+                    index.append([key, offset, len(raw), total, etag, expires, stale_until])
+                    chunks.append(raw)
+                    offset += len(raw)
+            finally:
+                if on_disk._buf is not None:
+                    on_disk._buf.close()
+            head = json.dumps(index).encode()
+            tmp = f'{path}.{os.getpid()}.tmp'
+            with open(tmp, 'wb') as f:
+                f.write(self.MAGIC)
+                f.write(len(head).to_bytes(8, 'big'))
+                f.write(head)
+                f.writelines(chunks)
+            os.replace(tmp, path)
+        return len(index)
+
+# LRU of formatted upstream results bounded by entry count and bytes. Expired
+# entries are served until stale_until while one background refresh runs, and
+# anything we still hold is served when upstream fails. Misses and refreshes
+# look in the boot snapshot and then the shared L2 before calling the loader,
+# and every loaded result is written through to the L2.
+class ResponseCache:
+    def __init__(self, max_entries, max_bytes, executor, shared=None, snapshot=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self.snapshot = snapshot
+        self.bytes = 0
+        self.hits = self.misses = self.stale_hits = self.stale_errors = 0
+        self.videos = weakref.WeakValueDictionary()  # id -> Video on some page still referenced
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._executor = executor
+
+    # loader() fetches the key, put()s it and returns the stored entry.
+    def get(self, key, loader):
+        now = time.monotonic()
+        with phase('cache'):
+            with self._lock:
+                entry = self._data.get(key)
+                if entry is not None:
+                    self._data.move_to_end(key)
+                    if now < entry.expires:
+                        self.hits += 1
+                        return entry
+                    if now < entry.stale_until:
+                        self.stale_hits += 1
+                        self._schedule_refresh(key, loader)
+                        return entry
+                self.misses += 1
+            shared = self._from_shared(key)
+        if shared is not None:
+            if time.monotonic() >= shared.expires:
+                with self._lock:
+                    self._schedule_refresh(key, loader)
+            return shared
+        try:
+            return loader()
+        except UpstreamError:
+            if entry is None:
+                raise
+            self.stale_errors += 1
+            return entry
+
+    def _schedule_refresh(self, key, loader):
+        if key not in self._refreshing:
+            self._refreshing.add(key)
+            self._executor.submit(self._refresh, key, loader)
+
+    def _from_shared(self, key):
+        found = self.snapshot.take(key) if self.snapshot is not None else None
+        if found is None and self.shared is not None:
+            found = self.shared.get(key)
+        return self._promote(key, found)
+
+    def _promote(self, key, found):
+        if found is None:
+            return None
+        raw, total, etag, fresh_for, stale_for = found
+        now = time.monotonic()
+        value = ([Video.from_dict(v) for v in app.json.loads(raw)], total)
+        return self._insert(key, CacheEntry(value, raw, etag, now + fresh_for, now + stale_for))
+
+    def put(self, key, value, ttl, stale_ttl=CACHE_STALE_TTL):
+        now = time.monotonic()
+        with phase('serialize'):
+            raw = app.json.dumps_bytes(value[0])
+            etag = hashlib.sha256(b'%s:%d' % (raw, value[1])).hexdigest()[:16]
+        entry = self._insert(key, CacheEntry(value, raw, etag, now + ttl, now + ttl + stale_ttl))
+        if self.shared is not None:
+            self.shared.put(key, entry, ttl, stale_ttl)
+        return entry
+
+    def _insert(self, key, entry):
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                old.held = False
+                self.bytes -= old.size
+            self._data[key] = entry
+            entry.held = True
+            self.bytes += entry.size
+            self._evict()
+            self.videos.update((v.id, v) for v in entry.value[0])
+        return entry
+
+    def _evict(self):
+        while len(self._data) > self.max_entries or (self.bytes > self.max_bytes and len(self._data) > 1):
+            _, evicted = self._data.popitem(last=False)
+            evicted.held = False
+            self.bytes -= evicted.size
+
+    # Keeps a response body built from entry, counted toward max_bytes while
+    # the entry is held. Returns the body stored first if two threads race.
+    def add_encoded(self, entry, variant, body):
+        with self._lock:
+            known = entry.encoded.get(variant)
+            if known is not None:
+                return known
+            entry.encoded[variant] = body
+            entry.size += len(body)
+            if entry.held:
+                self.bytes += len(body)
+                self._evict()
+        return body
+
+    # No L2 lookup here, but an entry still waiting in the snapshot counts.
+    def peek(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+        if entry is None and self.snapshot is not None:
+            entry = self._promote(key, self.snapshot.take(key))
+        return entry
+
+    def peek_shared(self, key):
+        return self._promote(key, self.shared.get(key)) if self.shared is not None else None
+
+    def save_snapshot(self, path):
+        with self._lock:
+            entries = list(self._data.items())
+        return (self.snapshot or CacheSnapshot()).save(path, entries)
+
+    # Another worker may already have refreshed this key into the L2.
+    def _refresh(self, key, loader):
+        try:
+            shared = self._from_shared(key)
+            if shared is None or time.monotonic() >= shared.expires:
+                loader()
+        except UpstreamError:
+            pass
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def __len__(self):
+        return len(self._data)
+
+response_cache = ResponseCache(CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, upstream.executor,
+                               SharedCache() if CACHE_SHARED_PATH else None,
+                               CacheSnapshot.load(CACHE_SNAPSHOT_PATH) if CACHE_SNAPSHOT_PATH else None)
+
+# The upstream copy of a video from a page we fetched, if one is still around.
+def upstream_video(vid_id):
+    return response_cache.videos.get(vid_id)
+
+class _Call:
+    __slots__ = ('event', 'result', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+# Collapses concurrent calls for the same key onto one in-flight call; every
+# waiter gets that call's result or re-raises its exception.
+class SingleFlight:
+    def __init__(self):
+        self.calls = self.collapsed = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            self.calls += 1
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = self._inflight[key] = _Call()
+            else:
+                self.collapsed += 1
+        if not leader:
+            left = time_left()
+            if not call.event.wait(None if left is None else max(0, left)):
+                raise UpstreamError("Deadline exceeded")
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.event.set()
+
+upstream_flight = SingleFlight()
+
+def cache_key(query, page, order, per_page):
+    return (' '.join(query.lower().split()), int(page), order, int(per_page))
+
+def _fetch_formatted(query, page, order, per_page):
+    with phase('upstream'):
+        videos, total = fetch_single_page(query, page, order, per_page)
+    with phase('format'):
+        result = format_page(videos)
+    store.refresh(result)
     return result, total
 
-def load_multi_page(query="korean", pages=3, order='latest'):
+# Callers collapsed onto one fetch share the entry it stores, so the page is
+# serialized and written to the L2 once, and its encoded bodies are shared.
+def _entry_loader(key, endpoint):
+    return lambda: upstream_flight.do(key, lambda: response_cache.put(key, _fetch_formatted(*key), CACHE_TTL[endpoint]))
+
+def load_entry(key, endpoint='data'):
+    return response_cache.get(key, _entry_loader(key, endpoint))
+
+class Prefetcher:
+    def __init__(self, workers=PREFETCH_WORKERS, depth=PREFETCH_DEPTH, max_pending=PREFETCH_MAX_PENDING):
+        self.enabled = PREFETCH_ENABLED
+        self.depth = depth
+        self.max_pending = max_pending
+        self.scheduled = self.skipped = self.failed = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='prefetch')
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._paused_until = 0
+
+    def under_pressure(self):
+        return (not upstream.breaker.closed or upstream.inflight >= PREFETCH_MAX_UPSTREAM_INFLIGHT
+                or time.monotonic() < self._paused_until)
+
+    def schedule(self, query, page, order, per_page, total):
+        if not self.enabled or self.under_pressure():
+            self.skipped += 1
+            return
+        now = time.monotonic()
+        for p in range(page + 1, page + 1 + self.depth):
+            if (p - 1) * per_page >= total:
+                break
+            key = cache_key(query, p, order, per_page)
+            entry = response_cache.peek(key)
+            if entry is not None and now < entry.expires:
+                continue
+            with self._lock:
+                if key in self._pending or len(self._pending) >= self.max_pending:
+                    self.skipped += 1
+                    continue
+                self._pending.add(key)
+            self.scheduled += 1
+            self._executor.submit(self._run, key)
+
+    def _run(self, key):
+        try:
+            load_entry(key)
+        except UpstreamError:
+            self.failed += 1
+            self._paused_until = time.monotonic() + PREFETCH_BACKOFF
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+prefetcher = Prefetcher()
+
+def load_pages(query, pages, order, start, per_page, deadline=MULTI_PAGE_DEADLINE):
+    futures = [submit_in_context(upstream.executor, load_entry, cache_key(query, p, order, per_page))
+               for p in range(start, start + pages)]
+    left = time_left()
+    done, _ = wait(futures, timeout=deadline if left is None else max(0, min(deadline, left)))
+    entries = []
+    # Stop at the first page that failed or missed the deadline so the client
+    # can resume from last_page + 1 without a gap.
+    for f in futures:
+        if f not in done or f.exception() is not None:
+            break
+        entries.append(f.result())
+    return entries
+
+def merge_pages(values):
     all_videos = []
+    seen = set()
     total = 0
-    with ThreadPoolExecutor(max_workers=pages) as executor:
-        futures = list(executor.map(lambda p: fetch_single_page(query, p, order, 24), range(1, pages + 1)))
-    for videos, t in futures:
+    for videos, t in values:
         if t > total:
             total = t
         for v in videos:
-            fmt = format_video(v)
-            if fmt and fmt['embed_url']:
-                all_videos.append(fmt)
+            if v.id not in seen:
+                seen.add(v.id)
+                all_videos.append(v)
     return all_videos, total
 
+def refresh_entry(key, endpoint='data'):
+    return _entry_loader(key, endpoint)()
+
+class CacheWarmer:
+    def __init__(self, interval=WARM_INTERVAL, workers=WARM_WORKERS, scope=WARM_SCOPE):
+        self.interval = interval
+        self.scope = scope
+        self.cycles = self.refreshed = self.failed = 0
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='warmer')
+        self._lock_file = None
+        self._thread = None
+
+    def jobs(self):
+        yield cache_key(*TRENDING), 'trending'
+        for query, _ in CATEGORIES:
+            for order, _ in SORT_ORDERS:
+                yield cache_key(query, 1, order, 24), 'data'
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name='warmer', daemon=True)
+            self._thread.start()
+
+    def _holds_host_lock(self):
+        if self.scope != 'host':
+            return True
+        if self._lock_file is None:
+            import fcntl
+            f = open(WARM_LOCK_PATH, 'a')
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                f.close()
+                return False
+            self._lock_file = f
+        return True
+
+    # Warming waits out an open breaker; live requests supply its probes.
+    def _loop(self):
+        while True:
+            if upstream.breaker.closed and self._holds_host_lock():
+                self.warm()
+            time.sleep(self.interval)
+
+    def warm(self):
+        # Refresh anything that would expire before the next cycle.
+        horizon = time.monotonic() + self.interval * 1.5
+        stale = [(key, endpoint) for key, endpoint in self.jobs() if not self._fresh(key, horizon)]
+        for ok in self._executor.map(lambda job: self._refresh(*job), stale):
+            if ok:
+                self.refreshed += 1
+            else:
+                self.failed += 1
+        self.cycles += 1
+
+    # Another worker's warmer may have refreshed the key into the L2 already;
+    # its copy is promoted instead of fetching the page again.
+    @staticmethod
+    def _fresh(key, horizon):
+        entry = response_cache.peek(key)
+        if entry is None or entry.expires < horizon:
+            entry = response_cache.peek_shared(key)
+        return entry is not None and entry.expires >= horizon
+
+    def _refresh(self, key, endpoint):
+        try:
+            refresh_entry(key, endpoint)
+            return True
+        except UpstreamError:
+            return False
+
+warmer = CacheWarmer()
+
+def save_snapshot():
+    try:
+        response_cache.save_snapshot(CACHE_SNAPSHOT_PATH)
+    except OSError as e:
+        print(f"Snapshot save error: {e}")
+
+def _snapshot_loop():
+    while True:
+        time.sleep(CACHE_SNAPSHOT_INTERVAL)
+        save_snapshot()
+
+def flush_metrics():
+    try:
+        metrics.flush()
+    except OSError as e:
+        print(f"Metrics flush error: {e}")
+
+def _metrics_loop():
+    while True:
+        time.sleep(METRICS_FLUSH_INTERVAL)
+        flush_metrics()
+
+if CACHE_SNAPSHOT_PATH:
+    atexit.register(save_snapshot)
+if METRICS_DIR:
+    atexit.register(flush_metrics)
+
+_background_started = False
+
+@app.before_request
+def _start_background():
+    global _background_started
+    if _background_started:
+        return
+    with data_lock:
+        if not _background_started:
+            _background_started = True
+            if WARM_ENABLED:
+                warmer.start()
+            if CACHE_SNAPSHOT_PATH:
+                threading.Thread(target=_snapshot_loop, name='snapshot', daemon=True).start()
+            if METRICS_DIR:
+                threading.Thread(target=_metrics_loop, name='metrics', daemon=True).start()
+            profiler.start()
+
+http_inflight = 0
+
+@app.before_request
+def _request_started():
+    global http_inflight
+    g.started = time.perf_counter()
+    g.request_id = request.headers.get('X-Request-ID', '')[:64] or os.urandom(8).hex()
+    g.spans = []
+    request_spans.set(g.spans)
+    request_deadline.set(time.monotonic() + REQUEST_DEADLINE)
+    g.route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    g.profile = profiler.begin(g.route)
+    with data_lock:
+        http_inflight += 1
+
+# Registered before compress_response, so it runs after it and the time
+# includes compression. A streamed body is still being produced here, so
+# its spans after the first byte are not reported.
+@app.after_request
+def _request_finished(resp):
+    elapsed = time.perf_counter() - g.started
+    route = g.route
+    metrics.observe('velvet_http_request_duration_seconds', (('route', route),), elapsed)
+    metrics.inc('velvet_http_requests_total', (('route', route), ('method', request.method), ('status', str(resp.status_code))))
+    # Pages fetched in parallel each add their own time, so a phase can
+    # exceed total.
+    phases = {}
+    for name, dur in g.spans:
+        phases[name] = phases.get(name, 0) + dur
+    resp.headers['X-Request-ID'] = g.request_id
+    if SERVER_TIMING:
+        resp.headers['Server-Timing'] = ', '.join(
+            [f'{name};dur={dur * 1000:.2f}' for name, dur in phases.items()] + [f'total;dur={elapsed * 1000:.2f}'])
+    if (TIMING_LOG_SLOW_MS and elapsed * 1000 >= TIMING_LOG_SLOW_MS) or random.random() < TIMING_LOG_SAMPLE:
+        print(json.dumps({"request_id": g.request_id, "method": request.method, "route": route,
+                          "path": request.path, "status": resp.status_code, "total_ms": round(elapsed * 1000, 2),
+                          **{f'{name}_ms': round(dur * 1000, 2) for name, dur in phases.items()}}))
+    return resp
+
+@app.teardown_request
+def _request_done(exc):
+    global http_inflight
+    if 'started' in g:
+        request_spans.set(None)
+        request_deadline.set(None)
+        profiler.end(g.route, g.pop('profile', None))
+        with data_lock:
+            http_inflight -= 1
+
+# --- HTTP CACHING ---
+def negotiate_encoding(available):
+    return request.accept_encodings.best_match([e for e in ('br', 'gzip') if e in available])
+
+def compress(body, encoding, level=None):
+    with phase('compress'):
+        if encoding == 'br':
+            return brotli.compress(body, quality=COMPRESS_BROTLI_QUALITY if level is None else level)
+        return gzip.compress(body, COMPRESS_LEVEL if level is None else level, mtime=0)
+
+def accepted_encoding():
+    return negotiate_encoding(('br', 'gzip') if brotli else ('gzip',))
+
+# Serves body under the given ETag (suffixed per encoding), answering 304 before
+# anything is compressed. encoded holds precomputed encodings; without it the
+# body is compressed on the fly.
+def conditional_response(body, content_type, etag, cache_control, encoded=None):
+    encoding = negotiate_encoding(encoded) if encoded is not None else accepted_encoding()
+    tagged = f'{etag}-{encoding}' if encoding else etag
+    if request.if_none_match.contains_weak(tagged):
+        resp = Response(status=304)
+    else:
+        if encoding:
+            body = encoded[encoding] if encoded is not None else compress(body, encoding)
+        resp = Response(body, content_type=content_type)
+        if encoding:
+            resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(tagged)
+    resp.headers['Cache-Control'] = cache_control
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+# 304 for a request whose If-None-Match carries etag, bare or with the
+# per-encoding suffix compression adds; None otherwise.
+def not_modified(etag, cache_control='no-cache'):
+    for tag in (etag, f'{etag}-gzip', f'{etag}-br'):
+        if request.if_none_match.contains_weak(tag):
+            resp = Response(status=304)
+            resp.set_etag(tag)
+            resp.headers['Cache-Control'] = cache_control
+            resp.vary.add('Accept-Encoding')
+            return resp
+    return None
+
+# JSON response for a cached upstream result. build(entry) returns the body
+# bytes (usually entry.raw spliced into an envelope); they and each compressed
+# form are stored on the entry under variant, so a hot result is built and
+# compressed once.
+def cached_json(entry, variant, build):
+    resp = not_modified(entry.etag)
+    if resp is not None:
+        return resp
+    body = entry.encoded.get(variant)
+    if body is None:
+        with phase('serialize'):
+            body = response_cache.add_encoded(entry, variant, build(entry))
+    encoding = accepted_encoding() if len(body) >= COMPRESS_MIN_SIZE else None
+    if encoding:
+        body = entry.encoded.get((variant, encoding))
+        if body is None:
+            body = response_cache.add_encoded(entry, (variant, encoding), compress(entry.encoded[variant], encoding))
+    resp = Response(body, mimetype='application/json')
+    if encoding:
+        resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(f'{entry.etag}-{encoding}' if encoding else entry.etag)
+    resp.headers['Cache-Control'] = 'no-cache'
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+@app.after_request
+def compress_response(resp):
+    if (resp.status_code != 200 or resp.is_streamed or resp.direct_passthrough
+            or resp.mimetype != 'application/json' or 'Content-Encoding' in resp.headers):
+        return resp
+    body = resp.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return resp
+    encoding = accepted_encoding()
+    if encoding:
+        resp.set_data(compress(body, encoding))
+        resp.headers['Content-Encoding'] = encoding
+        etag, weak = resp.get_etag()
+        if etag:
+            resp.set_etag(f'{etag}-{encoding}', weak)
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+# A response body fixed for the life of the process, compressed once up front
+# and served with a strong ETag per encoding.
+class StaticAsset:
+    def __init__(self, body, content_type):
+        self.body = body.encode() if isinstance(body, str) else body
+        self.content_type = content_type
+        self.etag = hashlib.sha256(self.body).hexdigest()[:16]
+        self.encoded = {'gzip': compress(self.body, 'gzip', 9)}
+        if brotli is not None:
+            self.encoded['br'] = compress(self.body, 'br', 11)
+
+    def response(self, cache_control):
+        return conditional_response(self.body, self.content_type, self.etag, cache_control, self.encoded)
+
+ASSETS = {}
+BOOTSTRAP_SLOT = '@@BOOTSTRAP@@'
+index_shell = None
+
+def build_frontend():
+    css = StaticAsset(APP_CSS, 'text/css; charset=utf-8')
+    js = StaticAsset(APP_JS, 'application/javascript; charset=utf-8')
+    ASSETS[f'app.{css.etag}.css'] = css
+    ASSETS[f'app.{js.etag}.js'] = js
+    with app.app_context():
+        html = render_template_string(
+            HTML_TEMPLATE, categories=CATEGORIES, sort_orders=SORT_ORDERS, bootstrap=BOOTSTRAP_SLOT,
+            css_url=f'/assets/app.{css.etag}.css', js_url=f'/assets/app.{js.etag}.js')
+    global index_shell
+    index_shell = html.split(BOOTSTRAP_SLOT)
+    return StaticAsset(html.replace(BOOTSTRAP_SLOT, 'null'), 'text/html; charset=utf-8')
+
+def _cached_value(key):
+    entry = response_cache.peek(key)
+    if entry is not None and time.monotonic() < entry.stale_until:
+        return entry.value
+    return None
+
+def build_bootstrap(user):
+    boot = {"me": me_payload(user)}
+    if boot['me']['logged_in']:
+        boot['favorite_ids'] = store.favorite_ids(user)
+    trending = _cached_value(cache_key(*TRENDING))
+    if trending is not None:
+        boot['trending'] = trending[0]
+    values = []
+    for p in range(1, BOOTSTRAP_FEED_PAGES + 1):
+        value = _cached_value(cache_key(CATEGORIES[0][0], p, SORT_ORDERS[0][0], 24))
+        if value is None:
+            break
+        values.append(value)
+    if values:
+        videos, total = merge_pages(values)
+        boot['feed'] = {"videos": videos, "total": total, "page": 1, "last_page": len(values)}
+    return boot
+
+# --- USER STORE ---
+# One shared copy of every video some user has favorited or watched, keyed by
+# id and refcounted by the per-user lists that point at it. Only upstream
+# copies go in (the catalog and response cache share them): the one from a
+# fetched page when a user saves the video, or a later page carrying it.
+# Until then each user sees the copy they sent themselves.
+class VideoCatalog:
+    def __init__(self):
+        self._videos = {}  # id -> video
+        self._refs = {}    # id -> {user: references}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._videos)
+
+    def __contains__(self, vid_id):
+        return vid_id in self._videos
+
+    def acquire(self, vid_id, user):
+        with self._lock:
+            holders = self._refs.setdefault(vid_id, {})
+            holders[user] = holders.get(user, 0) + 1
+
+    def release(self, vid_id, user):
+        with self._lock:
+            holders = self._refs[vid_id]
+            holders[user] -= 1
+            if not holders[user]:
+                del holders[user]
+                if not holders:
+                    del self._refs[vid_id]
+                    self._videos.pop(vid_id, None)
+
+    def holders(self, vid_id):
+        with self._lock:
+            return list(self._refs.get(vid_id, ()))
+
+    # Returns the ids whose copy now reads differently.
+    def refresh(self, videos):
+        changed = []
+        with self._lock:
+            for v in videos:
+                if v.id in self._refs:
+                    old = self._videos.get(v.id)
+                    if old is None or (old is not v and old.to_dict() != v.to_dict()):
+                        changed.append(v.id)
+                    self._videos[v.id] = v
+        return changed
+
+    # drafts: the user's own copies, for ids no upstream page has carried yet.
+    def resolve(self, ids, drafts=None):
+        get = self._videos.get
+        if drafts:
+            return [v for v in (get(vid_id) or drafts.get(vid_id) for vid_id in ids) if v is not None]
+        return [v for v in map(get, ids) if v is not None]
+
+# Favorite ids in insertion order with the time each was added. Each favorite
+# has a slot in the parallel _seqs/_ids arrays; removing one just blanks its
+# slot, and the arrays are compacted once blanks outnumber live entries, so
+# membership, add and remove are O(1) amortized. Pages are read newest-first
+# from a cursor (the seq of the last favorite already seen) with a bisect.
+class FavoriteList:
+    def __init__(self):
+        self._index = {}  # id -> [slot, added_at]
+        self._seqs = []
+        self._ids = []
+        self._next_seq = 0
+        self._holes = 0
+
+    def __len__(self):
+        return len(self._index)
+
+    def __contains__(self, vid_id):
+        return vid_id in self._index
+
+    def add(self, vid_id, added_at=None):
+        if vid_id in self._index:
+            return False
+        self._index[vid_id] = [len(self._ids), added_at or time.time()]
+        self._seqs.append(self._next_seq)
+        self._ids.append(vid_id)
+        self._next_seq += 1
+        return True
+
+    def remove(self, vid_id):
+        item = self._index.pop(vid_id, None)
+        if item is None:
+            return False
+        self._ids[item[0]] = None
+        self._holes += 1
+        if self._holes > len(self._index):
+            self._compact()
+        return True
+
+    def _compact(self):
+        seqs, ids = [], []
+        for seq, vid_id in zip(self._seqs, self._ids):
+            if vid_id is not None:
+                self._index[vid_id][0] = len(ids)
+                seqs.append(seq)
+                ids.append(vid_id)
+        self._seqs, self._ids, self._holes = seqs, ids, 0
+
+    def page(self, cursor=None, limit=None):
+        pos = (len(self._ids) if cursor is None else bisect_left(self._seqs, cursor)) - 1
+        ids = []
+        while pos >= 0 and (limit is None or len(ids) < limit):
+            vid_id = self._ids[pos]
+            if vid_id is not None:
+                ids.append(vid_id)
+            pos -= 1
+        next_cursor = self._seqs[pos + 1] if pos >= 0 else None
+        return ids, next_cursor
+
+    def ids(self):
+        return self.page()[0]
+
+# Watch history ids, most recent play last, with the time of that play.
+# Replaying a video moves it to the end and the oldest play drops off past
+# the cap; all O(1).
+class HistoryList:
+    def __init__(self, cap=HISTORY_MAX):
+        self.cap = cap
+        self._items = OrderedDict()  # id -> played_at
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, vid_id):
+        return vid_id in self._items
+
+    # Returns the id evicted to stay under the cap, if any.
+    def add(self, vid_id, played_at=None):
+        self._items[vid_id] = played_at or time.time()
+        self._items.move_to_end(vid_id)
+        if len(self._items) > self.cap:
+            return self._items.popitem(last=False)[0]
+        return None
+
+    def recent(self, limit=None):
+        return list(islice(reversed(self._items), limit))
+
+# Storage interface shared by both backends: users are dicts, videos come
+# back as Video records, and version(user, kind) moves on every write to
+# that user's 'favorites' or 'history' so responses can be revalidated.
+class MemoryStore:
+    def __init__(self):
+        self.epoch = os.urandom(4).hex()  # versions restart with the process
+        self._users = {}
+        self._favorites = {}  # username -> FavoriteList of video ids
+        self._history = {}    # username -> HistoryList of video ids
+        self._drafts = {}     # username -> {id: Video the user sent}
+        self._versions = {}   # (username, kind) -> change counter
+        self._catalog = VideoCatalog()
+        self._lock = threading.Lock()
+
+    def get_user(self, username):
+        return self._users.get(username)
+
+    def add_user(self, username, record):
+        with self._lock:
+            if username in self._users:
+                return False
+            self._users[username] = record
+            self._favorites[username] = FavoriteList()
+            self._history[username] = HistoryList()
+            return True
+
+    def counts(self, user):
+        return len(self._favorites.get(user, ())), len(self._history.get(user, ()))
+
+    def version(self, user, kind):
+        return self._versions.get((user, kind), 0)
+
+    def _bump(self, user, kind):
+        self._versions[(user, kind)] = self._versions.get((user, kind), 0) + 1
+
+    def favorite_ids(self, user):
+        favs = self._favorites.get(user)
+        return favs.ids() if favs else []
+
+    def favorites_page(self, user, cursor=None, limit=None):
+        favs = self._favorites.get(user)
+        if not favs:
+            return [], None
+        ids, next_cursor = favs.page(cursor, limit)
+        return self._catalog.resolve(ids, self._drafts.get(user)), next_cursor
+
+    def favorited(self, user, ids):
+        favs = self._favorites.get(user, ())
+        return {vid_id for vid_id in ids if vid_id in favs}
+
+    def _acquire(self, user, video):
+        self._catalog.acquire(video.id, user)
+        if video.id not in self._catalog:
+            known = upstream_video(video.id)
+            if known is not None:
+                self._bump_holders(self._catalog.refresh((known,)))
+            else:
+                self._drafts.setdefault(user, {})[video.id] = video
+        return video.id
+
+    def _release(self, user, vid_id):
+        self._catalog.release(vid_id, user)
+        drafts = self._drafts.get(user)
+        if drafts and vid_id not in self._favorites.get(user, ()) and vid_id not in self._history.get(user, ()):
+            drafts.pop(vid_id, None)
+
+    def toggle_favorite(self, user, video):
+        with self._lock:
+            favs = self._favorites.setdefault(user, FavoriteList())
+            favorited = video.id not in favs
+            if favorited:
+                favs.add(self._acquire(user, video))
+            else:
+                favs.remove(video.id)
+                self._release(user, video.id)
+            self._bump(user, 'favorites')
+        return favorited
+
+    def recent_history(self, user, limit=None):
+        hist = self._history.get(user)
+        return self._catalog.resolve(hist.recent(limit), self._drafts.get(user)) if hist else []
+
+    def add_history(self, user, video):
+        with self._lock:
+            hist = self._history.setdefault(user, HistoryList())
+            if video.id in hist:
+                hist.add(video.id)
+            else:
+                evicted = hist.add(self._acquire(user, video))
+                if evicted is not None:
+                    self._release(user, evicted)
+            self._bump(user, 'history')
+
+    # A changed copy changes the lists holding it, so their versions move.
+    def _bump_holders(self, vid_ids):
+        for vid_id in vid_ids:
+            for user in self._catalog.holders(vid_id):
+                if vid_id in self._favorites.get(user, ()):
+                    self._bump(user, 'favorites')
+                if vid_id in self._history.get(user, ()):
+                    self._bump(user, 'history')
+
+    def refresh(self, videos):
+        with self._lock:
+            self._bump_holders(self._catalog.refresh(videos))
+
+# The same store in one SQLite file in WAL mode, so every worker sees the
+# same users and readers never block the single writer. Each thread keeps
+# its own connection, and with it sqlite's prepared-statement cache; ids
+# passed as a set go in as one JSON array so those statements stay cacheable
+# too. Like VideoCatalog, upstream copies of videos are stored once in a
+# shared table and dropped when no favorite or history row points at them
+# any more; what a user sent goes in their own drafts rows, read only when
+# the shared table has no copy.
+class SQLiteStore:
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY, email TEXT NOT NULL, password TEXT NOT NULL,
+            created REAL NOT NULL, avatar TEXT NOT NULL);
+        CREATE TABLE IF NOT EXISTS videos (id TEXT PRIMARY KEY, data BLOB NOT NULL);
+        CREATE TABLE IF NOT EXISTS drafts (
+            user TEXT NOT NULL, video_id TEXT NOT NULL, data BLOB NOT NULL,
+            PRIMARY KEY (user, video_id)) WITHOUT ROWID;
+        CREATE TABLE IF NOT EXISTS favorites (
+            seq INTEGER PRIMARY KEY, user TEXT NOT NULL, video_id TEXT NOT NULL,
+            added_at REAL NOT NULL, UNIQUE (user, video_id));
+        CREATE INDEX IF NOT EXISTS favorites_by_user ON favorites (user, seq);
+        CREATE INDEX IF NOT EXISTS favorites_by_video ON favorites (video_id);
+        CREATE TABLE IF NOT EXISTS history (
+            seq INTEGER PRIMARY KEY, user TEXT NOT NULL, video_id TEXT NOT NULL,
+            played_at REAL NOT NULL, UNIQUE (user, video_id));
+        CREATE INDEX IF NOT EXISTS history_by_user ON history (user, seq);
+        CREATE INDEX IF NOT EXISTS history_by_video ON history (video_id);
+        CREATE TABLE IF NOT EXISTS versions (
+            user TEXT NOT NULL, kind TEXT NOT NULL, version INTEGER NOT NULL,
+            PRIMARY KEY (user, kind)) WITHOUT ROWID;
+    """
+
+    def __init__(self, path=STORE_PATH, history_max=HISTORY_MAX, busy_timeout=STORE_BUSY_TIMEOUT):
+        self.history_max = history_max
+        self._conns = ThreadConnections(path, busy_timeout)
+        self._db = self._conns.get
+        self._refresher = ThreadPoolExecutor(max_workers=1, thread_name_prefix='store-refresh')
+        db = self._conns.connect()
+        try:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.executescript(self.SCHEMA)
+            db.execute("INSERT OR IGNORE INTO meta VALUES ('epoch', ?)", (os.urandom(4).hex(),))
+            self.epoch = db.execute("SELECT value FROM meta WHERE key = 'epoch'").fetchone()[0]
+        finally:
+            db.close()
+
+    # One IMMEDIATE transaction per logical write, so the write lock is
+    # taken up front instead of on a read-to-write upgrade that can deadlock.
+    @contextmanager
+    def _write(self):
+        db = self._db()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    def _bump(self, db, user, kind):
+        db.execute('INSERT INTO versions VALUES (?, ?, 1) '
+                   'ON CONFLICT (user, kind) DO UPDATE SET version = version + 1', (user, kind))
+
+    # Writes upstream copies ((id, data) pairs that differ from what is
+    # stored) and moves the versions of the lists holding them, which now
+    # read differently.
+    def _store_videos(self, db, rows):
+        db.executemany('INSERT OR REPLACE INTO videos VALUES (?, ?)', rows)
+        ids = json.dumps([row[0] for row in rows])
+        for kind in ('favorites', 'history'):
+            db.execute(f'INSERT INTO versions SELECT DISTINCT user, ?2, 1 FROM {kind} '
+                       'WHERE video_id IN (SELECT value FROM json_each(?1)) '
+                       'ON CONFLICT (user, kind) DO UPDATE SET version = version + 1', (ids, kind))
+
+    def _acquire(self, db, user, video):
+        known = upstream_video(video.id)
+        if known is not None:
+            data = app.json.dumps_bytes(known)
+            old = db.execute('SELECT data FROM videos WHERE id = ?', (video.id,)).fetchone()
+            if old is None or old[0] != data:
+                self._store_videos(db, [(video.id, data)])
+        else:
+            db.execute('INSERT OR REPLACE INTO drafts SELECT ?1, ?2, ?3 WHERE NOT EXISTS (SELECT 1 FROM videos WHERE id = ?2)',
+                       (user, video.id, app.json.dumps_bytes(video)))
+        return video.id
+
+    def _release(self, db, user, vid_id):
+        db.execute('DELETE FROM drafts WHERE user = ?1 AND video_id = ?2 '
+                   'AND NOT EXISTS (SELECT 1 FROM favorites WHERE user = ?1 AND video_id = ?2) '
+                   'AND NOT EXISTS (SELECT 1 FROM history WHERE user = ?1 AND video_id = ?2)', (user, vid_id))
+        db.execute('DELETE FROM videos WHERE id = ?1 AND NOT EXISTS (SELECT 1 FROM favorites WHERE video_id = ?1) '
+                   'AND NOT EXISTS (SELECT 1 FROM history WHERE video_id = ?1)', (vid_id,))
+
+    @staticmethod
+    def _videos(rows):
+        loads = app.json.loads
+        return [Video.from_dict(loads(row[0])) for row in rows]
+
+    def get_user(self, username):
+        row = self._db().execute('SELECT email, password, created, avatar FROM users WHERE username = ?',
+                                 (username,)).fetchone()
+        if row is None:
+            return None
+        return {"email": row[0], "password": row[1], "created": row[2], "avatar": row[3]}
+
+    def add_user(self, username, record):
+        with self._write() as db:
+            cur = db.execute('INSERT OR IGNORE INTO users VALUES (?, ?, ?, ?, ?)',
+                             (username, record['email'], record['password'], record['created'], record['avatar']))
+        return cur.rowcount == 1
+
+    def counts(self, user):
+        return self._db().execute('SELECT (SELECT count(*) FROM favorites WHERE user = ?1), '
+                                  '(SELECT count(*) FROM history WHERE user = ?1)', (user,)).fetchone()
+
+    def version(self, user, kind):
+        row = self._db().execute('SELECT version FROM versions WHERE user = ? AND kind = ?', (user, kind)).fetchone()
+        return row[0] if row else 0
+
+    def favorite_ids(self, user):
+        rows = self._db().execute('SELECT video_id FROM favorites WHERE user = ? ORDER BY seq DESC', (user,))
+        return [row[0] for row in rows]
+
+    def favorites_page(self, user, cursor=None, limit=None):
+        # One row past the limit tells whether another page follows
+        rows = self._db().execute(
+            'SELECT coalesce(v.data, d.data), f.seq FROM favorites f LEFT JOIN videos v ON v.id = f.video_id '
+            'LEFT JOIN drafts d ON d.user = f.user AND d.video_id = f.video_id '
+            'WHERE f.user = ? AND f.seq < ? ORDER BY f.seq DESC LIMIT ?',
+            (user, cursor if cursor is not None else 1 << 62, -1 if limit is None else limit + 1)).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = rows[-1][1]
+        return self._videos(row for row in rows if row[0] is not None), next_cursor
+
+    def favorited(self, user, ids):
+        rows = self._db().execute('SELECT video_id FROM favorites WHERE user = ? '
+                                  'AND video_id IN (SELECT value FROM json_each(?))', (user, json.dumps(list(ids))))
+        return {row[0] for row in rows}
+
+    def toggle_favorite(self, user, video):
+        with self._write() as db:
+            removed = db.execute('DELETE FROM favorites WHERE user = ? AND video_id = ?', (user, video.id)).rowcount
+            if removed:
+                self._release(db, user, video.id)
+            else:
+                db.execute('INSERT INTO favorites (user, video_id, added_at) VALUES (?, ?, ?)',
+                           (user, self._acquire(db, user, video), time.time()))
+            self._bump(db, user, 'favorites')
+        return not removed
+
+    def recent_history(self, user, limit=None):
+        rows = self._db().execute(
+            'SELECT coalesce(v.data, d.data) FROM history h LEFT JOIN videos v ON v.id = h.video_id '
+            'LEFT JOIN drafts d ON d.user = h.user AND d.video_id = h.video_id '
+            'WHERE h.user = ? AND coalesce(v.data, d.data) IS NOT NULL ORDER BY h.seq DESC LIMIT ?', (user, -1 if limit is None else limit))
+        return self._videos(rows)
+
+    def add_history(self, user, video):
+        with self._write() as db:
+            # REPLACE gives a replayed video a new seq, moving it to the front
+            db.execute('INSERT OR REPLACE INTO history (user, video_id, played_at) VALUES (?, ?, ?)',
+                       (user, self._acquire(db, user, video), time.time()))
+            evicted = db.execute('SELECT video_id FROM history WHERE user = ? ORDER BY seq DESC LIMIT -1 OFFSET ?',
+                                 (user, self.history_max)).fetchall()
+            if evicted:
+                db.executemany('DELETE FROM history WHERE user = ? AND video_id = ?', [(user, row[0]) for row in evicted])
+                for row in evicted:
+                    self._release(db, user, row[0])
+            self._bump(db, user, 'history')
+
+    # Stores upstream copies of the videos some user has saved, on a
+    # background thread so the request that fetched the page never waits on
+    # the write lock. Returns the future, or None for an empty page.
+    def refresh(self, videos):
+        if videos:
+            return self._refresher.submit(self._refresh, videos)
+
+    # Most pages contain no saved video and most saved ones are unchanged, so
+    # a read finds the ids and their stored bytes first and only rows that
+    # differ are written, in one transaction.
+    def _refresh(self, videos):
+        by_id = {v.id: v for v in videos}
+        try:
+            ids = json.dumps(list(by_id))
+            known = self._db().execute(
+                'SELECT r.video_id, v.data FROM (SELECT video_id FROM favorites WHERE video_id IN (SELECT value FROM json_each(?1)) '
+                'UNION SELECT video_id FROM history WHERE video_id IN (SELECT value FROM json_each(?1))) r '
+                'LEFT JOIN videos v ON v.id = r.video_id', (ids,)).fetchall()
+            dumps = app.json.dumps_bytes
+            changed = [(vid_id, data) for vid_id, data, old in
+                       ((vid_id, dumps(by_id[vid_id]), old) for vid_id, old in known) if data != old]
+            if changed:
+                with self._write() as db:
+                    self._store_videos(db, changed)
+        except sqlite3.Error as e:
+            print(f"Store refresh error: {e}")
+
+store = SQLiteStore() if STORE_BACKEND == 'sqlite' else MemoryStore()
+
+def user_etag(user, kind):
+    version = store.version(user, kind)
+    return f'{kind}-' + hashlib.sha256(f'{store.epoch}:{user}:{version}'.encode()).hexdigest()[:16]
+
 # --- ROUTES ---
-@app.route('/api/data')
-def get_data():
+def _feed_args():
     query = request.args.get('q', 'korean')
     page = int(request.args.get('page', 1))
     order = request.args.get('order', 'latest')
     per_page = int(request.args.get('per_page', 24))
-    videos, total = load_content(query, page, order, per_page)
-    return jsonify({"videos": videos, "total": total, "page": page})
+    pages = max(1, min(int(request.args.get('pages', 1)), MULTI_PAGE_MAX))
+    return query, page, order, per_page, pages
+
+@app.route('/api/data')
+def get_data():
+    query, page, order, per_page, pages = _feed_args()
+    if pages > 1:
+        entries = load_pages(query, pages, order, page, per_page)
+        last_page = page + len(entries) - 1
+        etag = hashlib.sha256(f'{last_page}:{",".join(e.etag for e in entries)}'.encode()).hexdigest()[:16]
+        resp = not_modified(etag)
+        if resp is None:
+            videos, total = merge_pages(e.value for e in entries)
+            prefetcher.schedule(query, last_page, order, per_page, total)
+            resp = jsonify({"videos": videos, "total": total, "page": page, "last_page": last_page})
+            resp.set_etag(etag)
+            resp.headers['Cache-Control'] = 'no-cache'
+        return resp
+    try:
+        entry = load_entry(cache_key(query, page, order, per_page))
+    except UpstreamError:
+        return jsonify({"videos": [], "total": 0, "page": page})
+    prefetcher.schedule(query, page, order, per_page, entry.value[1])
+    return cached_json(entry, 'data', lambda e: b'{"videos":%s,"total":%d,"page":%d}' % (e.raw, e.value[1], page))
+
+# NDJSON: one {"page", "total", "videos"} line per upstream page as it lands
+# (first come, first served), then {"done": true, "last_page"} where
+# last_page is the end of the contiguous run of completed pages.
+@app.route('/api/data/stream')
+def stream_data():
+    query, page, order, per_page, pages = _feed_args()
+
+    def generate():
+        futures = {upstream.executor.submit(load_entry, cache_key(query, p, order, per_page)): p
+                   for p in range(page, page + pages)}
+        seen = set()
+        completed = set()
+        total = 0
+        try:
+            for f in as_completed(futures, timeout=MULTI_PAGE_DEADLINE):
+                if f.exception() is not None:
+                    continue
+                videos, t = f.result().value
+                total = max(total, t)
+                completed.add(futures[f])
+                fresh = [v for v in videos if v.id not in seen]
+                seen.update(v.id for v in fresh)
+                yield app.json.dumps_bytes({"page": futures[f], "total": t, "videos": fresh}) + b'\n'
+        except TimeoutError:
+            pass
+        last_page = page - 1
+        while last_page + 1 in completed:
+            last_page += 1
+        prefetcher.schedule(query, last_page, order, per_page, total)
+        yield app.json.dumps_bytes({"done": True, "total": total, "last_page": last_page}) + b'\n'
+
+    return Response(generate(), mimetype='application/x-ndjson',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @app.route('/api/trending')
 def get_trending():
-    videos, total = load_content('sex', 1, 'top-weekly', 12)
-    return jsonify({"videos": videos})
+    try:
+        entry = load_entry(cache_key(*TRENDING), 'trending')
+    except UpstreamError:
+        return jsonify({"videos": []})
+    return cached_json(entry, 'trending', lambda e: b'{"videos":%s}' % e.raw)
 
 @app.route('/api/related')
 def get_related():
     query = request.args.get('q', 'sex')
     page = int(request.args.get('page', 1))
-    videos, _ = load_content(query, page, 'top-rated', 12)
-    return jsonify({"videos": videos})
+    try:
+        entry = load_entry(cache_key(query, page, 'top-rated', 12), 'related')
+    except UpstreamError:
+        return jsonify({"videos": []})
+    return cached_json(entry, 'related', lambda e: b'{"videos":%s}' % e.raw)
 
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -118,12 +2299,10 @@ def register():
         return jsonify({"error": "Username must be at least 3 characters"}), 400
     if len(password) < 6:
         return jsonify({"error": "Password must be at least 6 characters"}), 400
-    if username in users_db:
-        return jsonify({"error": "Username already taken"}), 409
     hashed = hashlib.sha256(password.encode()).hexdigest()
-    users_db[username] = {"email": email, "password": hashed, "created": time.time(), "avatar": username[0].upper()}
-    favorites_db[username] = []
-    history_db[username] = []
+    record = {"email": email, "password": hashed, "created": time.time(), "avatar": username[0].upper()}
+    if not store.add_user(username, record):
+        return jsonify({"error": "Username already taken"}), 409
     session['user'] = username
     return jsonify({"success": True, "username": username})
 
@@ -134,7 +2313,7 @@ def login():
     password = data.get('password', '')
     if not username or not password:
         return jsonify({"error": "Username and password required"}), 400
-    user = users_db.get(username)
+    user = store.get_user(username)
     if not user:
         return jsonify({"error": "Invalid username or password"}), 401
     hashed = hashlib.sha256(password.encode()).hexdigest()
@@ -148,27 +2327,45 @@ def logout():
     session.pop('user', None)
     return jsonify({"success": True})
 
-@app.route('/api/me')
-def me():
-    user = session.get('user')
-    if not user or user not in users_db:
-        return jsonify({"logged_in": False})
-    u = users_db[user]
-    return jsonify({
+def me_payload(user):
+    u = store.get_user(user) if user else None
+    if u is None:
+        return {"logged_in": False}
+    favorites_count, history_count = store.counts(user)
+    return {
         "logged_in": True,
         "username": user,
         "avatar": u.get('avatar', user[0].upper()),
         "email": u.get('email', ''),
-        "favorites_count": len(favorites_db.get(user, [])),
-        "history_count": len(history_db.get(user, []))
-    })
+        "favorites_count": favorites_count,
+        "history_count": history_count
+    }
+
+@app.route('/api/me')
+def me():
+    return jsonify(me_payload(session.get('user')))
 
 @app.route('/api/favorites', methods=['GET'])
 def get_favorites():
     user = session.get('user')
     if not user:
         return jsonify({"error": "Not logged in"}), 401
-    return jsonify({"videos": favorites_db.get(user, [])})
+    etag = user_etag(user, 'favorites')
+    resp = not_modified(etag, 'private, no-cache')
+    if resp is not None:
+        return resp
+    if request.args.get('ids_only') == '1':
+        resp = jsonify({"ids": store.favorite_ids(user)})
+    elif 'limit' in request.args or 'cursor' in request.args:
+        limit = max(1, min(int(request.args.get('limit', 48)), FAVORITES_PAGE_MAX))
+        cursor = request.args.get('cursor')
+        videos, next_cursor = store.favorites_page(user, int(cursor) if cursor else None, limit)
+        resp = jsonify({"videos": videos, "next_cursor": next_cursor})
+    else:
+        resp = jsonify({"videos": store.favorites_page(user)[0]})
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
 
 @app.route('/api/favorites', methods=['POST'])
 def toggle_favorite():
@@ -176,51 +2373,180 @@ def toggle_favorite():
     if not user:
         return jsonify({"error": "Not logged in"}), 401
     data = request.get_json()
-    video = data.get('video')
-    if not video:
+    video = Video.from_client(data.get('video'))
+    if video is None:
         return jsonify({"error": "No video data"}), 400
-    favs = favorites_db.setdefault(user, [])
-    existing = next((i for i, f in enumerate(favs) if f['id'] == video['id']), None)
-    if existing is not None:
-        favs.pop(existing)
-        return jsonify({"favorited": False})
-    else:
-        favs.insert(0, video)
-        return jsonify({"favorited": True})
+    return jsonify({"favorited": store.toggle_favorite(user, video)})
 
 @app.route('/api/history', methods=['GET'])
 def get_history():
     user = session.get('user')
     if not user:
         return jsonify({"videos": []})
-    return jsonify({"videos": history_db.get(user, [])[:50]})
+    etag = user_etag(user, 'history')
+    resp = not_modified(etag, 'private, no-cache')
+    if resp is None:
+        resp = jsonify({"videos": store.recent_history(user, 50)})
+        resp.set_etag(etag)
+        resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
 
 @app.route('/api/history', methods=['POST'])
 def add_history():
     user = session.get('user')
     data = request.get_json()
-    video = data.get('video')
-    if not video:
+    video = Video.from_client(data.get('video'))
+    if video is None:
         return jsonify({"error": "No video"}), 400
-    if user and user in users_db:
-        hist = history_db.setdefault(user, [])
-        hist = [h for h in hist if h['id'] != video['id']]
-        hist.insert(0, video)
-        history_db[user] = hist[:100]
+    if user and store.get_user(user) is not None:
+        store.add_history(user, video)
     return jsonify({"success": True})
 
+# ?id=x -> {"favorited": bool}; ?ids=a,b,c -> {"favorited": {id: bool}}
 @app.route('/api/is_favorite')
 def is_favorite():
     user = session.get('user')
+    ids = request.args.get('ids')
+    if ids is not None:
+        ids = [vid_id for vid_id in ids.split(',')[:FAVORITES_PAGE_MAX] if vid_id]
+        favs = store.favorited(user, ids) if user else ()
+        return jsonify({"favorited": {vid_id: vid_id in favs for vid_id in ids}})
     vid_id = request.args.get('id')
     if not user or not vid_id:
         return jsonify({"favorited": False})
-    favs = favorites_db.get(user, [])
-    return jsonify({"favorited": any(f['id'] == vid_id for f in favs)})
+    return jsonify({"favorited": vid_id in store.favorited(user, (vid_id,))})
+
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+
+# Each sub-request gets its own app context, and so its own g: sharing the
+# batch's would run the batch's teardown once per sub-request. It keeps the
+# batch's deadline and timing spans, which live in context vars.
+def _run_subrequest(path, cookie):
+    with app.app_context(), app.test_request_context(path, headers={'Cookie': cookie}):
+        try:
+            rv = app.make_response(app.dispatch_request())
+        except HTTPException as e:
+            return {"status": e.code, "body": {"error": e.description}}
+        except Exception as e:
+            print(f"Batch error: {e}")
+            return {"status": 500, "body": {"error": "Internal error"}}
+        return {"status": rv.status_code, "body": rv.get_json()}
+
+@app.route('/api/batch', methods=['POST'])
+def batch():
+    data = request.get_json(silent=True) or {}
+    subrequests = data.get('requests') or []
+    if not isinstance(subrequests, list) or len(subrequests) > BATCH_MAX_REQUESTS:
+        return jsonify({"error": f"Send at most {BATCH_MAX_REQUESTS} requests"}), 400
+    cookie = request.headers.get('Cookie', '')
+    responses = {}
+    futures = {}
+    if not all(isinstance(sub, dict) and isinstance(sub.get('path', ''), str) for sub in subrequests):
+        return jsonify({"error": "Each request needs a string path"}), 400
+    for i, sub in enumerate(subrequests):
+        sub_id = str(sub.get('id', i))
+        path = sub.get('path', '')
+        if path.split('?', 1)[0] not in BATCH_PATHS:
+            responses[sub_id] = {"status": 400, "body": {"error": "Path not allowed"}}
+        elif path.split('?', 1)[0] in BATCH_UPSTREAM_PATHS:
+            futures[sub_id] = submit_in_context(batch_executor, _run_subrequest, path, cookie)
+        else:
+            responses[sub_id] = _run_subrequest(path, cookie)
+    for sub_id, f in futures.items():
+        responses[sub_id] = f.result()
+    return jsonify({"responses": responses})
 
 @app.route('/')
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    if not INLINE_BOOTSTRAP:
+        return index_page.response('no-cache')
+    # JSON inside <script>: escape '<' so no value can close the tag
+    blob = app.json.dumps(build_bootstrap(session.get('user'))).replace('<', '\\u003c')
+    etag = f'{index_page.etag}.{hashlib.sha256(blob.encode()).hexdigest()[:16]}'
+    resp = conditional_response(blob.join(index_shell).encode(), index_page.content_type, etag, 'private, no-cache')
+    resp.vary.add('Cookie')
+    return resp
+
+@app.route('/assets/<name>')
+def asset(name):
+    a = ASSETS.get(name)
+    if a is None:
+        return jsonify({"error": "Not found"}), 404
+    return a.response('public, max-age=31536000, immutable')
+
+@metrics.collector
+def _component_metrics():
+    c, s = response_cache, response_cache.shared
+    yield 'velvet_cache_lookups_total', (('tier', 'l1'), ('result', 'hit')), c.hits
+    yield 'velvet_cache_lookups_total', (('tier', 'l1'), ('result', 'stale')), c.stale_hits
+    yield 'velvet_cache_lookups_total', (('tier', 'l1'), ('result', 'miss')), c.misses
+    if s is not None:
+        yield 'velvet_cache_lookups_total', (('tier', 'l2'), ('result', 'hit')), s.hits
+        yield 'velvet_cache_lookups_total', (('tier', 'l2'), ('result', 'stale')), s.stale_hits
+        yield 'velvet_cache_lookups_total', (('tier', 'l2'), ('result', 'miss')), s.misses
+        yield 'velvet_cache_lookups_total', (('tier', 'l2'), ('result', 'error')), s.errors
+    if c.snapshot is not None:
+        yield 'velvet_cache_lookups_total', (('tier', 'snapshot'), ('result', 'hit')), c.snapshot.used
+    yield 'velvet_cache_stale_errors_total', (), c.stale_errors
+    yield 'velvet_cache_entries', (), len(c)
+    yield 'velvet_cache_bytes', (), c.bytes
+    yield 'velvet_upstream_collapsed_total', (), upstream_flight.collapsed
+    yield 'velvet_upstream_in_flight', (), upstream.inflight
+    yield 'velvet_upstream_hedges_total', (('result', 'fired'),), upstream.hedged
+    yield 'velvet_upstream_hedges_total', (('result', 'won'),), upstream.hedge_wins
+    for state in (CircuitBreaker.CLOSED, CircuitBreaker.OPEN, CircuitBreaker.HALF_OPEN):
+        yield 'velvet_upstream_breaker_state', (('state', state),), int(upstream.breaker.state == state)
+    yield 'velvet_upstream_breaker_opened_total', (), upstream.breaker.opened
+    yield 'velvet_upstream_rejected_total', (('reason', 'breaker'),), upstream.breaker.rejected
+    yield 'velvet_upstream_rejected_total', (('reason', 'limit'),), upstream.limiter.rejected
+    yield 'velvet_upstream_concurrency_limit', (), upstream.limiter.limit
+    yield 'velvet_http_requests_in_flight', (), http_inflight
+    for result in ('scheduled', 'skipped', 'failed'):
+        yield 'velvet_prefetch_total', (('result', result),), getattr(prefetcher, result)
+    for pool, executor in (('upstream', upstream.executor), ('prefetch', prefetcher._executor),
+                           ('warmer', warmer._executor), ('batch', batch_executor)):
+        yield 'velvet_executor_queue_depth', (('pool', pool),), executor._work_queue.qsize()
+    if isinstance(store, SQLiteStore):
+        yield 'velvet_executor_queue_depth', (('pool', 'store'),), store._refresher._work_queue.qsize()
+
+@app.route('/metrics')
+def metrics_endpoint():
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+# This worker's profiles. ?format=text (pstats report), pstats (marshalled,
+# loads with pstats.Stats(path)) or collapsed (stack samples for
+# flamegraph.pl / speedscope); no format lists what has been collected.
+# ?route= narrows to one route and ?reset=1 clears after reading.
+@app.route('/debug/profile')
+def profile_dump():
+    token = request.headers.get('Authorization', '').removeprefix('Bearer ') or request.args.get('token', '')
+    if not PROFILE_TOKEN or not hmac.compare_digest(token.encode(), PROFILE_TOKEN.encode()):
+        return jsonify({"error": "Not found"}), 404
+    route = request.args.get('route')
+    fmt = request.args.get('format')
+    if fmt == 'collapsed':
+        resp = Response(profiler.collapsed(route), mimetype='text/plain')
+    elif fmt in ('text', 'pstats'):
+        stats = profiler.stats(route)
+        if stats is None:
+            return jsonify({"error": "No profiles collected"}), 404
+        if fmt == 'pstats':
+            resp = Response(marshal.dumps(stats.stats), mimetype='application/octet-stream',
+                            headers={'Content-Disposition': f'attachment; filename=profile-{os.getpid()}.pstats'})
+        else:
+            sort = request.args.get('sort', 'cumulative')
+            if sort not in stats.sort_arg_dict_default:
+                return jsonify({"error": f"Unknown sort key {sort}"}), 400
+            out = io.StringIO()
+            stats.stream = out
+            stats.sort_stats(sort).print_stats(int(request.args.get('limit', 60)))
+            resp = Response(out.getvalue(), mimetype='text/plain')
+    else:
+        resp = jsonify(profiler.routes())
+    if request.args.get('reset') == '1':
+        profiler.reset()
+    resp.headers['Cache-Control'] = 'no-store'
+    return resp
 
 # --- FRONTEND TEMPLATE ---
 HTML_TEMPLATE = r"""
@@ -234,261 +2560,7 @@ HTML_TEMPLATE = r"""
     <link rel="preconnect" href="https://fonts.googleapis.com">
     <link href="https://fonts.googleapis.com/css2?family=Playfair+Display:wght@700;900&family=DM+Sans:wght@300;400;500;600&display=swap" rel="stylesheet">
     <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.5.0/css/all.min.css">
-    <style>
-        :root {
-            --bg: #080808;
-            --surface: #111111;
-            --surface2: #181818;
-            --border: rgba(255,255,255,0.07);
-            --pink: #e91e8c;
-            --pink-dark: #b5166d;
-            --pink-glow: rgba(233, 30, 140, 0.3);
-            --text: #f0e6f0;
-            --text-muted: #776677;
-            --text-dim: #3d2d3d;
-            --gold: #d4af37;
-            --radius: 10px;
-        }
-        * { box-sizing: border-box; margin: 0; padding: 0; -webkit-tap-highlight-color: transparent; }
-        html { scroll-behavior: smooth; }
-        body {
-            background: var(--bg);
-            color: var(--text);
-            font-family: 'DM Sans', sans-serif;
-            font-size: 14px;
-            overflow-x: hidden;
-            padding-bottom: 80px;
-            min-height: 100vh;
-        }
-        /* Block ALL content visibility until age is verified */
-        body.age-locked { overflow: hidden; }
-        body.age-locked header,
-        body.age-locked #section-main,
-        body.age-locked #section-favorites,
-        body.age-locked #section-history,
-        body.age-locked .bottom-nav,
-        body.age-locked .fab,
-        body.age-locked #progress-bar,
-        body.age-locked #toast { visibility: hidden !important; pointer-events: none !important; }
-        body::before {
-            content: '';
-            position: fixed;
-            inset: 0;
-            background: radial-gradient(ellipse 80% 60% at 50% -20%, rgba(233,30,140,0.08) 0%, transparent 70%);
-            pointer-events: none;
-            z-index: 0;
-        }
-        ::-webkit-scrollbar { width: 4px; }
-        ::-webkit-scrollbar-track { background: var(--bg); }
-        ::-webkit-scrollbar-thumb { background: var(--pink); border-radius: 2px; }
-        .hidden { display: none !important; }
-
-        /* ---- AGE GATE ---- */
-        #age-gate {
-            position: fixed; inset: 0; background: #000; z-index: 99999;
-            display: flex; flex-direction: column; align-items: center; justify-content: center;
-            text-align: center; padding: 30px;
-        }
-        .age-logo { font-family: 'Playfair Display', serif; font-size: 52px; font-weight: 900; color: var(--pink); letter-spacing: -2px; margin-bottom: 8px; text-shadow: 0 0 40px var(--pink-glow); }
-        .age-subtitle { color: var(--text-muted); font-size: 11px; letter-spacing: 4px; text-transform: uppercase; margin-bottom: 40px; }
-        .age-warning { width: 70px; height: 70px; border-radius: 50%; background: rgba(233,30,140,0.1); border: 2px solid var(--pink); display: flex; align-items: center; justify-content: center; margin: 0 auto 24px; }
-        .age-warning i { font-size: 28px; color: var(--pink); }
-        .age-gate h2 { font-size: 22px; font-weight: 700; color: #fff; margin-bottom: 10px; }
-        .age-gate p { color: var(--text-muted); font-size: 13px; max-width: 300px; margin: 0 auto 32px; line-height: 1.6; }
-        .age-btns { display: flex; gap: 12px; }
-        .btn-enter { background: linear-gradient(135deg, var(--pink), var(--pink-dark)); color: white; padding: 14px 36px; border-radius: 50px; font-weight: 600; font-size: 15px; cursor: pointer; border: none; box-shadow: 0 0 30px var(--pink-glow); transition: all 0.2s; letter-spacing: 0.5px; }
-        .btn-enter:hover { transform: translateY(-1px); box-shadow: 0 0 40px var(--pink-glow); }
-        .btn-leave { background: transparent; color: var(--text-muted); padding: 14px 28px; border-radius: 50px; font-weight: 500; font-size: 15px; cursor: pointer; border: 1px solid var(--border); transition: all 0.2s; }
-        .btn-leave:hover { border-color: var(--text-muted); color: var(--text); }
-        .age-disclaimer { margin-top: 28px; color: var(--text-dim); font-size: 11px; max-width: 320px; line-height: 1.5; }
-
-        /* ---- HEADER ---- */
-        header {
-            position: sticky; top: 0; background: rgba(8,8,8,0.95); z-index: 200;
-            border-bottom: 1px solid var(--border); backdrop-filter: blur(20px);
-        }
-        .header-top { display: flex; align-items: center; justify-content: space-between; padding: 12px 16px; gap: 12px; }
-        .logo { font-family: 'Playfair Display', serif; font-size: 26px; font-weight: 900; color: var(--pink); letter-spacing: -1px; cursor: pointer; text-shadow: 0 0 20px var(--pink-glow); flex-shrink: 0; }
-        .logo span { color: var(--text); }
-        .search-wrap { flex: 1; position: relative; max-width: 400px; }
-        .search-wrap i { position: absolute; left: 12px; top: 50%; transform: translateY(-50%); color: var(--text-muted); font-size: 13px; pointer-events: none; }
-        .search-input { width: 100%; background: var(--surface2); border: 1px solid var(--border); border-radius: 50px; padding: 9px 16px 9px 36px; color: var(--text); font-size: 13px; font-family: 'DM Sans', sans-serif; outline: none; transition: all 0.2s; }
-        .search-input:focus { border-color: var(--pink); background: var(--surface); box-shadow: 0 0 0 3px var(--pink-glow); }
-        .search-input::placeholder { color: var(--text-dim); }
-        .header-actions { display: flex; align-items: center; gap: 8px; flex-shrink: 0; }
-        .icon-btn { background: var(--surface2); border: 1px solid var(--border); color: var(--text-muted); width: 36px; height: 36px; border-radius: 50%; display: flex; align-items: center; justify-content: center; cursor: pointer; transition: all 0.2s; font-size: 14px; }
-        .icon-btn:hover { color: var(--pink); border-color: var(--pink); }
-        .login-btn { background: linear-gradient(135deg, var(--pink), var(--pink-dark)); color: white; border: none; padding: 8px 18px; border-radius: 50px; font-size: 12px; font-weight: 600; cursor: pointer; font-family: 'DM Sans', sans-serif; white-space: nowrap; transition: all 0.2s; }
-        .login-btn:hover { box-shadow: 0 0 20px var(--pink-glow); }
-        .user-avatar { width: 36px; height: 36px; border-radius: 50%; background: linear-gradient(135deg, var(--pink), var(--pink-dark)); color: white; display: flex; align-items: center; justify-content: center; font-weight: 700; font-size: 14px; cursor: pointer; border: 2px solid transparent; transition: all 0.2s; }
-        .user-avatar:hover { border-color: var(--pink); }
-
-        /* ---- CATEGORIES BAR ---- */
-        .cat-bar { display: flex; gap: 4px; overflow-x: auto; padding: 0 12px 12px; scrollbar-width: none; }
-        .cat-bar::-webkit-scrollbar { display: none; }
-        .cat-pill { padding: 6px 14px; border-radius: 50px; font-size: 11px; font-weight: 600; text-transform: uppercase; letter-spacing: 0.8px; cursor: pointer; border: 1px solid var(--border); color: var(--text-muted); background: transparent; white-space: nowrap; transition: all 0.2s; }
-        .cat-pill:hover { color: var(--text); border-color: rgba(255,255,255,0.2); }
-        .cat-pill.active { background: var(--pink); color: white; border-color: var(--pink); box-shadow: 0 0 15px var(--pink-glow); }
-
-        /* ---- SORT BAR ---- */
-        .sort-bar { display: flex; align-items: center; gap: 8px; padding: 8px 16px; border-bottom: 1px solid var(--border); overflow-x: auto; scrollbar-width: none; }
-        .sort-bar::-webkit-scrollbar { display: none; }
-        .sort-label { color: var(--text-muted); font-size: 11px; text-transform: uppercase; letter-spacing: 1px; flex-shrink: 0; }
-        .sort-btn { padding: 5px 12px; border-radius: 6px; font-size: 11px; font-weight: 500; cursor: pointer; border: 1px solid var(--border); color: var(--text-muted); background: transparent; white-space: nowrap; transition: all 0.15s; }
-        .sort-btn.active, .sort-btn:hover { background: var(--surface2); color: var(--text); border-color: rgba(255,255,255,0.2); }
-        .sort-btn.active { color: var(--pink); border-color: var(--pink); }
-        .results-count { margin-left: auto; color: var(--text-muted); font-size: 11px; flex-shrink: 0; white-space: nowrap; }
-
-        /* ---- HERO / TRENDING STRIP ---- */
-        .section-title { display: flex; align-items: center; gap: 8px; padding: 20px 16px 12px; }
-        .section-title h2 { font-family: 'Playfair Display', serif; font-size: 18px; font-weight: 700; color: var(--text); }
-        .section-title .badge { background: var(--pink); color: white; padding: 2px 8px; border-radius: 4px; font-size: 10px; font-weight: 700; text-transform: uppercase; letter-spacing: 1px; }
-        .trending-scroll { display: flex; gap: 10px; overflow-x: auto; padding: 0 16px 16px; scrollbar-width: none; }
-        .trending-scroll::-webkit-scrollbar { display: none; }
-        .trending-card { flex-shrink: 0; width: 150px; cursor: pointer; }
-        .trending-card img { width: 100%; aspect-ratio: 16/9; object-fit: cover; border-radius: 8px; background: var(--surface2); transition: transform 0.2s; }
-        .trending-card:hover img { transform: scale(1.03); }
-        .trending-card .tc-title { font-size: 12px; font-weight: 500; color: var(--text); margin-top: 6px; overflow: hidden; display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical; line-height: 1.3; }
-        .trending-card .tc-meta { font-size: 10px; color: var(--text-muted); margin-top: 3px; }
-        .trending-card .tc-duration { position: absolute; bottom: 5px; right: 5px; background: rgba(0,0,0,0.8); color: white; font-size: 10px; font-weight: 600; padding: 2px 5px; border-radius: 4px; }
-        .tc-thumb { position: relative; }
-
-        /* ---- MAIN GRID ---- */
-        .main-grid { display: grid; grid-template-columns: repeat(2, 1fr); gap: 10px; padding: 12px 12px; }
-        @media(min-width: 480px) { .main-grid { grid-template-columns: repeat(3, 1fr); } }
-        @media(min-width: 768px) { .main-grid { grid-template-columns: repeat(4, 1fr); } }
-        @media(min-width: 1024px) { .main-grid { grid-template-columns: repeat(5, 1fr); } }
-
-        .video-card { cursor: pointer; position: relative; animation: fadeIn 0.3s ease both; }
-        @keyframes fadeIn { from { opacity: 0; transform: translateY(8px); } to { opacity: 1; transform: translateY(0); } }
-        .video-card .thumb-wrap { position: relative; border-radius: var(--radius); overflow: hidden; aspect-ratio: 16/9; background: var(--surface2); }
-        .video-card img { width: 100%; height: 100%; object-fit: cover; transition: transform 0.3s; display: block; }
-        .video-card:hover img { transform: scale(1.05); }
-        .video-card .overlay { position: absolute; inset: 0; background: linear-gradient(to top, rgba(0,0,0,0.8) 0%, transparent 50%); opacity: 0; transition: opacity 0.2s; display: flex; align-items: center; justify-content: center; }
-        .video-card:hover .overlay { opacity: 1; }
-        .play-icon { width: 44px; height: 44px; background: var(--pink); border-radius: 50%; display: flex; align-items: center; justify-content: center; box-shadow: 0 0 20px var(--pink-glow); }
-        .play-icon i { font-size: 16px; color: white; margin-left: 3px; }
-        .video-card .duration-badge { position: absolute; bottom: 6px; right: 6px; background: rgba(0,0,0,0.85); color: white; font-size: 10px; font-weight: 600; padding: 2px 6px; border-radius: 4px; }
-        .video-card .vr-badge { position: absolute; top: 6px; left: 6px; background: var(--gold); color: #000; font-size: 9px; font-weight: 700; padding: 2px 5px; border-radius: 3px; letter-spacing: 0.5px; }
-        .video-card .fav-btn { position: absolute; top: 6px; right: 6px; width: 28px; height: 28px; background: rgba(0,0,0,0.7); border: none; border-radius: 50%; display: flex; align-items: center; justify-content: center; cursor: pointer; color: white; font-size: 12px; opacity: 0; transition: opacity 0.2s; }
-        .video-card:hover .fav-btn { opacity: 1; }
-        .fav-btn.favorited { opacity: 1 !important; color: var(--pink) !important; }
-        .video-card .card-info { padding: 7px 2px 2px; }
-        .video-card .card-title { font-size: 12px; font-weight: 500; color: var(--text); overflow: hidden; display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical; line-height: 1.4; }
-        .video-card .card-meta { display: flex; align-items: center; gap: 6px; margin-top: 4px; }
-        .card-rating { color: var(--gold); font-size: 10px; font-weight: 600; }
-        .card-views { color: var(--text-muted); font-size: 10px; }
-        .card-cat { background: var(--surface2); color: var(--text-muted); font-size: 9px; padding: 2px 6px; border-radius: 3px; text-transform: uppercase; letter-spacing: 0.5px; }
-
-        /* ---- LOAD MORE ---- */
-        .load-more-wrap { display: flex; justify-content: center; padding: 24px; }
-        .load-more-btn { background: var(--surface2); border: 1px solid var(--border); color: var(--text); padding: 12px 36px; border-radius: 50px; font-size: 13px; font-weight: 600; cursor: pointer; font-family: 'DM Sans', sans-serif; transition: all 0.2s; }
-        .load-more-btn:hover { border-color: var(--pink); color: var(--pink); }
-
-        /* ---- SPINNER ---- */
-        .spinner-wrap { display: flex; justify-content: center; align-items: center; padding: 60px; }
-        .spinner { width: 36px; height: 36px; border: 3px solid var(--surface2); border-top-color: var(--pink); border-radius: 50%; animation: spin 0.7s linear infinite; }
-        @keyframes spin { to { transform: rotate(360deg); } }
-
-        /* ---- FAB ---- */
-        .fab { position: fixed; bottom: 90px; right: 16px; width: 48px; height: 48px; background: linear-gradient(135deg, var(--pink), var(--pink-dark)); border-radius: 50%; display: flex; align-items: center; justify-content: center; box-shadow: 0 4px 20px var(--pink-glow); z-index: 300; cursor: pointer; transition: all 0.2s; }
-        .fab:active { transform: scale(0.9); }
-        .fab i { color: white; font-size: 18px; transition: transform 0.3s; }
-        .fab.spinning i { animation: spin 0.5s linear; }
-
-        /* ---- PLAYER MODAL ---- */
-        #player-modal { position: fixed; inset: 0; background: #000; z-index: 600; overflow-y: auto; display: none; padding-bottom: 80px; }
-        .player-header { position: sticky; top: 0; background: rgba(0,0,0,0.95); z-index: 10; padding: 12px 16px; display: flex; align-items: center; gap: 12px; border-bottom: 1px solid var(--border); backdrop-filter: blur(10px); }
-        .back-btn { width: 36px; height: 36px; background: var(--surface2); border-radius: 50%; display: flex; align-items: center; justify-content: center; cursor: pointer; color: var(--text); flex-shrink: 0; }
-        .player-header-title { font-weight: 600; font-size: 14px; overflow: hidden; text-overflow: ellipsis; white-space: nowrap; flex: 1; }
-        .player-fav-btn { background: var(--surface2); border: 1px solid var(--border); color: var(--text-muted); width: 36px; height: 36px; border-radius: 50%; display: flex; align-items: center; justify-content: center; cursor: pointer; flex-shrink: 0; transition: all 0.2s; font-size: 14px; }
-        .player-fav-btn.fav-active { color: var(--pink); border-color: var(--pink); background: rgba(233,30,140,0.1); }
-        .video-frame-wrap { width: 100%; aspect-ratio: 16/9; background: #000; position: relative; }
-        #main-iframe { width: 100%; height: 100%; border: none; display: block; }
-        .player-body { padding: 16px; }
-        .player-title { font-family: 'Playfair Display', serif; font-size: 18px; font-weight: 700; line-height: 1.3; margin-bottom: 10px; }
-        .player-meta { display: flex; flex-wrap: wrap; gap: 10px; margin-bottom: 16px; }
-        .meta-chip { display: flex; align-items: center; gap: 5px; background: var(--surface2); padding: 6px 12px; border-radius: 50px; font-size: 12px; color: var(--text-muted); }
-        .meta-chip i { color: var(--pink); font-size: 11px; }
-        .tags-wrap { display: flex; flex-wrap: wrap; gap: 6px; margin-bottom: 20px; }
-        .tag { padding: 4px 10px; background: var(--surface2); border: 1px solid var(--border); border-radius: 4px; font-size: 11px; color: var(--text-muted); cursor: pointer; transition: all 0.15s; }
-        .tag:hover { color: var(--pink); border-color: var(--pink); }
-        .section-divider { border: none; border-top: 1px solid var(--border); margin: 20px 0; }
-        .related-grid { display: grid; grid-template-columns: repeat(2, 1fr); gap: 10px; }
-        @media(min-width: 480px) { .related-grid { grid-template-columns: repeat(3, 1fr); } }
-
-        /* ---- AUTH MODAL ---- */
-        .modal-backdrop { position: fixed; inset: 0; background: rgba(0,0,0,0.85); z-index: 800; display: flex; align-items: center; justify-content: center; padding: 20px; backdrop-filter: blur(8px); }
-        .modal-box { background: var(--surface); border: 1px solid var(--border); border-radius: 16px; width: 100%; max-width: 380px; padding: 28px; position: relative; }
-        .modal-box h2 { font-family: 'Playfair Display', serif; font-size: 22px; font-weight: 700; margin-bottom: 6px; }
-        .modal-box .sub { color: var(--text-muted); font-size: 13px; margin-bottom: 24px; }
-        .modal-close { position: absolute; top: 16px; right: 16px; width: 30px; height: 30px; background: var(--surface2); border-radius: 50%; display: flex; align-items: center; justify-content: center; cursor: pointer; color: var(--text-muted); font-size: 13px; }
-        .form-group { margin-bottom: 14px; }
-        .form-label { font-size: 11px; font-weight: 600; text-transform: uppercase; letter-spacing: 0.8px; color: var(--text-muted); display: block; margin-bottom: 6px; }
-        .form-input { width: 100%; background: var(--surface2); border: 1px solid var(--border); border-radius: 8px; padding: 11px 14px; color: var(--text); font-size: 14px; font-family: 'DM Sans', sans-serif; outline: none; transition: all 0.2s; }
-        .form-input:focus { border-color: var(--pink); box-shadow: 0 0 0 3px var(--pink-glow); }
-        .form-submit { width: 100%; background: linear-gradient(135deg, var(--pink), var(--pink-dark)); color: white; border: none; padding: 13px; border-radius: 8px; font-size: 14px; font-weight: 600; cursor: pointer; font-family: 'DM Sans', sans-serif; margin-top: 6px; transition: all 0.2s; }
-        .form-submit:hover { box-shadow: 0 0 25px var(--pink-glow); }
-        .form-error { color: #ff4466; font-size: 12px; margin-top: 6px; display: none; }
-        .form-switch { text-align: center; margin-top: 16px; font-size: 13px; color: var(--text-muted); }
-        .form-switch a { color: var(--pink); cursor: pointer; font-weight: 500; }
-
-        /* ---- USER MENU ---- */
-        .user-menu { position: fixed; top: 60px; right: 12px; background: var(--surface); border: 1px solid var(--border); border-radius: 12px; width: 220px; z-index: 500; overflow: hidden; box-shadow: 0 8px 30px rgba(0,0,0,0.5); }
-        .user-menu-header { padding: 16px; border-bottom: 1px solid var(--border); }
-        .user-menu-name { font-weight: 700; font-size: 15px; color: var(--text); }
-        .user-menu-email { font-size: 11px; color: var(--text-muted); margin-top: 2px; }
-        .menu-item { padding: 12px 16px; display: flex; align-items: center; gap: 10px; cursor: pointer; color: var(--text-muted); font-size: 13px; transition: all 0.15s; }
-        .menu-item:hover { background: var(--surface2); color: var(--text); }
-        .menu-item i { width: 16px; text-align: center; color: var(--pink); font-size: 13px; }
-        .menu-item.danger { color: #ff4466; }
-        .menu-item.danger i { color: #ff4466; }
-
-        /* ---- TOAST ---- */
-        #toast { position: fixed; bottom: 90px; left: 50%; transform: translateX(-50%) translateY(20px); background: var(--surface2); border: 1px solid var(--border); color: var(--text); padding: 10px 20px; border-radius: 50px; font-size: 13px; font-weight: 500; z-index: 9999; opacity: 0; transition: all 0.3s; pointer-events: none; white-space: nowrap; box-shadow: 0 4px 20px rgba(0,0,0,0.4); }
-        #toast.show { opacity: 1; transform: translateX(-50%) translateY(0); }
-        #toast.success i { color: #22c55e; }
-        #toast.error i { color: #ff4466; }
-
-        /* ---- EMPTY STATE ---- */
-        .empty-state { text-align: center; padding: 60px 20px; }
-        .empty-state i { font-size: 48px; color: var(--text-dim); margin-bottom: 16px; }
-        .empty-state h3 { font-size: 18px; font-weight: 700; color: var(--text-muted); margin-bottom: 8px; }
-        .empty-state p { font-size: 13px; color: var(--text-dim); }
-
-        /* ---- SKELETON SHIMMER ---- */
-        @keyframes shimmer { 0% { background-position: -400px 0; } 100% { background-position: 400px 0; } }
-        .thumb-wrap img { background: var(--surface2); }
-        .thumb-wrap img.loading-img {
-            background: linear-gradient(90deg, var(--surface2) 25%, #222 50%, var(--surface2) 75%);
-            background-size: 400px 100%;
-            animation: shimmer 1.4s ease infinite;
-        }
-
-        /* ---- INFINITE SCROLL SENTINEL ---- */
-        #scroll-sentinel { height: 1px; width: 100%; }
-        .infinite-spinner { display: flex; justify-content: center; align-items: center; padding: 30px; }
-        .infinite-spinner .spinner { width: 28px; height: 28px; border-width: 2px; }
-
-        /* ---- PROGRESS BAR ---- */
-        #progress-bar { position: fixed; top: 0; left: 0; height: 2px; background: linear-gradient(90deg, var(--pink), #ff6bb0); z-index: 99999; width: 0; transition: width 0.3s; }
-
-        /* ---- BOTTOM NAV ---- */
-        .bottom-nav { position: fixed; bottom: 0; left: 0; right: 0; background: rgba(8,8,8,0.97); border-top: 1px solid var(--border); display: flex; z-index: 400; backdrop-filter: blur(20px); }
-        .nav-item { flex: 1; display: flex; flex-direction: column; align-items: center; justify-content: center; padding: 10px 4px 12px; cursor: pointer; color: var(--text-muted); font-size: 10px; gap: 4px; transition: color 0.2s; }
-        .nav-item i { font-size: 18px; }
-        .nav-item.active { color: var(--pink); }
-        .nav-item span { font-weight: 500; }
-
-        /* ---- TABS ---- */
-        #section-main, #section-favorites, #section-history { display: none; }
-        #section-main.active-section, #section-favorites.active-section, #section-history.active-section { display: block; }
-
-        /* ---- NO RESULTS ---- */
-        .no-results { text-align: center; padding: 80px 20px; }
-        .no-results i { font-size: 40px; color: var(--text-dim); margin-bottom: 16px; display: block; }
-        .no-results p { color: var(--text-muted); font-size: 14px; }
-    </style>
+    <link rel="stylesheet" href="{{ css_url }}">
 </head>
 <body>
 
@@ -525,47 +2597,15 @@ HTML_TEMPLATE = r"""
         </div>
     </div>
     <div class="cat-bar" id="cat-bar">
-        <div class="cat-pill active" onclick="setCategory('korean', this)">Korean</div>
-        <div class="cat-pill" onclick="setCategory('japanese', this)">Japanese</div>
-        <div class="cat-pill" onclick="setCategory('amateur', this)">Amateur</div>
-        <div class="cat-pill" onclick="setCategory('hentai', this)">Hentai</div>
-        <div class="cat-pill" onclick="setCategory('milf', this)">MILF</div>
-        <div class="cat-pill" onclick="setCategory('asian', this)">Asian</div>
-        <div class="cat-pill" onclick="setCategory('vr', this)">VR</div>
-        <div class="cat-pill" onclick="setCategory('blonde', this)">Blonde</div>
-        <div class="cat-pill" onclick="setCategory('latina', this)">Latina</div>
-        <div class="cat-pill" onclick="setCategory('pov', this)">POV</div>
-        <div class="cat-pill" onclick="setCategory('teen', this)">Teen 18+</div>
-        <div class="cat-pill" onclick="setCategory('threesome', this)">Threesome</div>
-        <div class="cat-pill" onclick="setCategory('lesbian', this)">Lesbian</div>
-        <div class="cat-pill" onclick="setCategory('bdsm', this)">BDSM</div>
-        <div class="cat-pill" onclick="setCategory('creampie', this)">Creampie</div>
-        <div class="cat-pill" onclick="setCategory('step sister nun strapon', this)">The Nun</div>
-        <div class="cat-pill" onclick="setCategory('Adriana chechik', this)">Adriana</div>
-        <div class="cat-pill" onclick="setCategory('step brother', this)">Step Bro</div>
-        <div class="cat-pill" onclick="setCategory('Vina sky', this)">Vina Sky</div>
-        <div class="cat-pill" onclick="setCategory('Aria alexander', this)">Aria Alexander</div>
-        <div class="cat-pill" onclick="setCategory('Melayu gangbang', this)">Melayu</div>
-        <div class="cat-pill" onclick="setCategory('Kitty meana wolf', this)">Meana Wolf</div>
-        <div class="cat-pill" onclick="setCategory('mom son taboo', this)">Mom</div>
-        <div class="cat-pill" onclick="setCategory('Nurul', this)">Nurul</div>
-        <div class="cat-pill" onclick="setCategory('Kurashina kana', this)">Kana</div>
-        <div class="cat-pill" onclick="setCategory('korean movie', this)">Korean Movie</div>
-        <div class="cat-pill" onclick="setCategory('married couple', this)">Married</div>
-        <div class="cat-pill" onclick="setCategory('british mom', this)">British Mom</div>
-        <div class="cat-pill" onclick="setCategory('Ava adams', this)">Ava Adams</div>
-        <div class="cat-pill" onclick="setCategory('gangbang', this)">Gangbang</div>
-        <div class="cat-pill" onclick="setCategory('anal', this)">Anal</div>
-        <div class="cat-pill" onclick="setCategory('squirt', this)">Squirt</div>
-        <div class="cat-pill" onclick="setCategory('massage', this)">Massage</div>
+        {% for query, label in categories %}
+        <div class="cat-pill{{ ' active' if loop.first }}" onclick="setCategory('{{ query }}', this)">{{ label }}</div>
+        {% endfor %}
     </div>
     <div class="sort-bar">
         <span class="sort-label">Sort:</span>
-        <button class="sort-btn active" onclick="setSort('latest', this)">Latest</button>
-        <button class="sort-btn" onclick="setSort('top-weekly', this)">Hot</button>
-        <button class="sort-btn" onclick="setSort('top-monthly', this)">Monthly</button>
-        <button class="sort-btn" onclick="setSort('top-rated', this)">Top Rated</button>
-        <button class="sort-btn" onclick="setSort('most-popular', this)">Most Viewed</button>
+        {% for order, label in sort_orders %}
+        <button class="sort-btn{{ ' active' if loop.first }}" onclick="setSort('{{ order }}', this)">{{ label }}</button>
+        {% endfor %}
         <div class="results-count" id="results-count"></div>
     </div>
 </header>
@@ -595,6 +2635,7 @@ HTML_TEMPLATE = r"""
 <div id="section-favorites">
     <div class="section-title"><h2>❤️ My Favorites</h2></div>
     <div class="main-grid" id="fav-grid"></div>
+    <button class="load-more hidden" id="fav-more" onclick="loadFavoritesPage(true)">Load more</button>
     <div class="empty-state hidden" id="fav-empty">
         <i class="fa fa-heart"></i>
         <h3>No favorites yet</h3>
@@ -708,7 +2749,271 @@ HTML_TEMPLATE = r"""
     </div>
 </nav>
 
-<script>
+<script id="bootstrap" type="application/json">{{ bootstrap }}</script>
+<script src="{{ js_url }}"></script>
+</body>
+</html>
+"""
+
+APP_CSS = r"""
+:root {
+    --bg: #080808;
+    --surface: #111111;
+    --surface2: #181818;
+    --border: rgba(255,255,255,0.07);
+    --pink: #e91e8c;
+    --pink-dark: #b5166d;
+    --pink-glow: rgba(233, 30, 140, 0.3);
+    --text: #f0e6f0;
+    --text-muted: #776677;
+    --text-dim: #3d2d3d;
+    --gold: #d4af37;
+    --radius: 10px;
+}
+* { box-sizing: border-box; margin: 0; padding: 0; -webkit-tap-highlight-color: transparent; }
+html { scroll-behavior: smooth; }
+body {
+    background: var(--bg);
+    color: var(--text);
+    font-family: 'DM Sans', sans-serif;
+    font-size: 14px;
+    overflow-x: hidden;
+    padding-bottom: 80px;
+    min-height: 100vh;
+}
+/* Block ALL content visibility until age is verified */
+body.age-locked { overflow: hidden; }
+body.age-locked header,
+body.age-locked #section-main,
+body.age-locked #section-favorites,
+body.age-locked #section-history,
+body.age-locked .bottom-nav,
+body.age-locked .fab,
+body.age-locked #progress-bar,
+body.age-locked #toast { visibility: hidden !important; pointer-events: none !important; }
+body::before {
+    content: '';
+    position: fixed;
+    inset: 0;
+    background: radial-gradient(ellipse 80% 60% at 50% -20%, rgba(233,30,140,0.08) 0%, transparent 70%);
+    pointer-events: none;
+    z-index: 0;
+}
+::-webkit-scrollbar { width: 4px; }
+::-webkit-scrollbar-track { background: var(--bg); }
+::-webkit-scrollbar-thumb { background: var(--pink); border-radius: 2px; }
+.hidden { display: none !important; }
+
+/* ---- AGE GATE ---- */
+#age-gate {
+    position: fixed; inset: 0; background: #000; z-index: 99999;
+    display: flex; flex-direction: column; align-items: center; justify-content: center;
+    text-align: center; padding: 30px;
+}
+.age-logo { font-family: 'Playfair Display', serif; font-size: 52px; font-weight: 900; color: var(--pink); letter-spacing: -2px; margin-bottom: 8px; text-shadow: 0 0 40px var(--pink-glow); }
+.age-subtitle { color: var(--text-muted); font-size: 11px; letter-spacing: 4px; text-transform: uppercase; margin-bottom: 40px; }
+.age-warning { width: 70px; height: 70px; border-radius: 50%; background: rgba(233,30,140,0.1); border: 2px solid var(--pink); display: flex; align-items: center; justify-content: center; margin: 0 auto 24px; }
+.age-warning i { font-size: 28px; color: var(--pink); }
+.age-gate h2 { font-size: 22px; font-weight: 700; color: #fff; margin-bottom: 10px; }
+.age-gate p { color: var(--text-muted); font-size: 13px; max-width: 300px; margin: 0 auto 32px; line-height: 1.6; }
+.age-btns { display: flex; gap: 12px; }
+.btn-enter { background: linear-gradient(135deg, var(--pink), var(--pink-dark)); color: white; padding: 14px 36px; border-radius: 50px; font-weight: 600; font-size: 15px; cursor: pointer; border: none; box-shadow: 0 0 30px var(--pink-glow); transition: all 0.2s; letter-spacing: 0.5px; }
+.btn-enter:hover { transform: translateY(-1px); box-shadow: 0 0 40px var(--pink-glow); }
+.btn-leave { background: transparent; color: var(--text-muted); padding: 14px 28px; border-radius: 50px; font-weight: 500; font-size: 15px; cursor: pointer; border: 1px solid var(--border); transition: all 0.2s; }
+.btn-leave:hover { border-color: var(--text-muted); color: var(--text); }
+.age-disclaimer { margin-top: 28px; color: var(--text-dim); font-size: 11px; max-width: 320px; line-height: 1.5; }
+
+/* ---- HEADER ---- */
+header {
+    position: sticky; top: 0; background: rgba(8,8,8,0.95); z-index: 200;
+    border-bottom: 1px solid var(--border); backdrop-filter: blur(20px);
+}
+.header-top { display: flex; align-items: center; justify-content: space-between; padding: 12px 16px; gap: 12px; }
+.logo { font-family: 'Playfair Display', serif; font-size: 26px; font-weight: 900; color: var(--pink); letter-spacing: -1px; cursor: pointer; text-shadow: 0 0 20px var(--pink-glow); flex-shrink: 0; }
+.logo span { color: var(--text); }
+.search-wrap { flex: 1; position: relative; max-width: 400px; }
+.search-wrap i { position: absolute; left: 12px; top: 50%; transform: translateY(-50%); color: var(--text-muted); font-size: 13px; pointer-events: none; }
+.search-input { width: 100%; background: var(--surface2); border: 1px solid var(--border); border-radius: 50px; padding: 9px 16px 9px 36px; color: var(--text); font-size: 13px; font-family: 'DM Sans', sans-serif; outline: none; transition: all 0.2s; }
+.search-input:focus { border-color: var(--pink); background: var(--surface); box-shadow: 0 0 0 3px var(--pink-glow); }
+.search-input::placeholder { color: var(--text-dim); }
+.header-actions { display: flex; align-items: center; gap: 8px; flex-shrink: 0; }
+.icon-btn { background: var(--surface2); border: 1px solid var(--border); color: var(--text-muted); width: 36px; height: 36px; border-radius: 50%; display: flex; align-items: center; justify-content: center; cursor: pointer; transition: all 0.2s; font-size: 14px; }
+.icon-btn:hover { color: var(--pink); border-color: var(--pink); }
+.login-btn { background: linear-gradient(135deg, var(--pink), var(--pink-dark)); color: white; border: none; padding: 8px 18px; border-radius: 50px; font-size: 12px; font-weight: 600; cursor: pointer; font-family: 'DM Sans', sans-serif; white-space: nowrap; transition: all 0.2s; }
+.login-btn:hover { box-shadow: 0 0 20px var(--pink-glow); }
+.user-avatar { width: 36px; height: 36px; border-radius: 50%; background: linear-gradient(135deg, var(--pink), var(--pink-dark)); color: white; display: flex; align-items: center; justify-content: center; font-weight: 700; font-size: 14px; cursor: pointer; border: 2px solid transparent; transition: all 0.2s; }
+.user-avatar:hover { border-color: var(--pink); }
+
+/* ---- CATEGORIES BAR ---- */
+.cat-bar { display: flex; gap: 4px; overflow-x: auto; padding: 0 12px 12px; scrollbar-width: none; }
+.cat-bar::-webkit-scrollbar { display: none; }
+.cat-pill { padding: 6px 14px; border-radius: 50px; font-size: 11px; font-weight: 600; text-transform: uppercase; letter-spacing: 0.8px; cursor: pointer; border: 1px solid var(--border); color: var(--text-muted); background: transparent; white-space: nowrap; transition: all 0.2s; }
+.cat-pill:hover { color: var(--text); border-color: rgba(255,255,255,0.2); }
+.cat-pill.active { background: var(--pink); color: white; border-color: var(--pink); box-shadow: 0 0 15px var(--pink-glow); }
+
+/* ---- SORT BAR ---- */
+.sort-bar { display: flex; align-items: center; gap: 8px; padding: 8px 16px; border-bottom: 1px solid var(--border); overflow-x: auto; scrollbar-width: none; }
+.sort-bar::-webkit-scrollbar { display: none; }
+.sort-label { color: var(--text-muted); font-size: 11px; text-transform: uppercase; letter-spacing: 1px; flex-shrink: 0; }
+.sort-btn { padding: 5px 12px; border-radius: 6px; font-size: 11px; font-weight: 500; cursor: pointer; border: 1px solid var(--border); color: var(--text-muted); background: transparent; white-space: nowrap; transition: all 0.15s; }
+.sort-btn.active, .sort-btn:hover { background: var(--surface2); color: var(--text); border-color: rgba(255,255,255,0.2); }
+.sort-btn.active { color: var(--pink); border-color: var(--pink); }
+.results-count { margin-left: auto; color: var(--text-muted); font-size: 11px; flex-shrink: 0; white-space: nowrap; }
+
+/* ---- HERO / TRENDING STRIP ---- */
+.section-title { display: flex; align-items: center; gap: 8px; padding: 20px 16px 12px; }
+.section-title h2 { font-family: 'Playfair Display', serif; font-size: 18px; font-weight: 700; color: var(--text); }
+.section-title .badge { background: var(--pink); color: white; padding: 2px 8px; border-radius: 4px; font-size: 10px; font-weight: 700; text-transform: uppercase; letter-spacing: 1px; }
+.trending-scroll { display: flex; gap: 10px; overflow-x: auto; padding: 0 16px 16px; scrollbar-width: none; }
+.trending-scroll::-webkit-scrollbar { display: none; }
+.trending-card { flex-shrink: 0; width: 150px; cursor: pointer; }
+.trending-card img { width: 100%; aspect-ratio: 16/9; object-fit: cover; border-radius: 8px; background: var(--surface2); transition: transform 0.2s; }
+.trending-card:hover img { transform: scale(1.03); }
+.trending-card .tc-title { font-size: 12px; font-weight: 500; color: var(--text); margin-top: 6px; overflow: hidden; display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical; line-height: 1.3; }
+.trending-card .tc-meta { font-size: 10px; color: var(--text-muted); margin-top: 3px; }
+.trending-card .tc-duration { position: absolute; bottom: 5px; right: 5px; background: rgba(0,0,0,0.8); color: white; font-size: 10px; font-weight: 600; padding: 2px 5px; border-radius: 4px; }
+.tc-thumb { position: relative; }
+
+/* ---- MAIN GRID ---- */
+.main-grid { display: grid; grid-template-columns: repeat(2, 1fr); gap: 10px; padding: 12px 12px; }
+@media(min-width: 480px) { .main-grid { grid-template-columns: repeat(3, 1fr); } }
+@media(min-width: 768px) { .main-grid { grid-template-columns: repeat(4, 1fr); } }
+@media(min-width: 1024px) { .main-grid { grid-template-columns: repeat(5, 1fr); } }
+
+.video-card { cursor: pointer; position: relative; animation: fadeIn 0.3s ease both; }
+@keyframes fadeIn { from { opacity: 0; transform: translateY(8px); } to { opacity: 1; transform: translateY(0); } }
+.video-card .thumb-wrap { position: relative; border-radius: var(--radius); overflow: hidden; aspect-ratio: 16/9; background: var(--surface2); }
+.video-card img { width: 100%; height: 100%; object-fit: cover; transition: transform 0.3s; display: block; }
+.video-card:hover img { transform: scale(1.05); }
+.video-card .overlay { position: absolute; inset: 0; background: linear-gradient(to top, rgba(0,0,0,0.8) 0%, transparent 50%); opacity: 0; transition: opacity 0.2s; display: flex; align-items: center; justify-content: center; }
+.video-card:hover .overlay { opacity: 1; }
+.play-icon { width: 44px; height: 44px; background: var(--pink); border-radius: 50%; display: flex; align-items: center; justify-content: center; box-shadow: 0 0 20px var(--pink-glow); }
+.play-icon i { font-size: 16px; color: white; margin-left: 3px; }
+.video-card .duration-badge { position: absolute; bottom: 6px; right: 6px; background: rgba(0,0,0,0.85); color: white; font-size: 10px; font-weight: 600; padding: 2px 6px; border-radius: 4px; }
+.video-card .vr-badge { position: absolute; top: 6px; left: 6px; background: var(--gold); color: #000; font-size: 9px; font-weight: 700; padding: 2px 5px; border-radius: 3px; letter-spacing: 0.5px; }
+.video-card .fav-btn { position: absolute; top: 6px; right: 6px; width: 28px; height: 28px; background: rgba(0,0,0,0.7); border: none; border-radius: 50%; display: flex; align-items: center; justify-content: center; cursor: pointer; color: white; font-size: 12px; opacity: 0; transition: opacity 0.2s; }
+.video-card:hover .fav-btn { opacity: 1; }
+.fav-btn.favorited { opacity: 1 !important; color: var(--pink) !important; }
+.video-card .card-info { padding: 7px 2px 2px; }
+.video-card .card-title { font-size: 12px; font-weight: 500; color: var(--text); overflow: hidden; display: -webkit-box; -webkit-line-clamp: 2; -webkit-box-orient: vertical; line-height: 1.4; }
+.video-card .card-meta { display: flex; align-items: center; gap: 6px; margin-top: 4px; }
+.card-rating { color: var(--gold); font-size: 10px; font-weight: 600; }
+.card-views { color: var(--text-muted); font-size: 10px; }
+.card-cat { background: var(--surface2); color: var(--text-muted); font-size: 9px; padding: 2px 6px; border-radius: 3px; text-transform: uppercase; letter-spacing: 0.5px; }
+
+/* ---- LOAD MORE ---- */
+.load-more-wrap { display: flex; justify-content: center; padding: 24px; }
+.load-more-btn { background: var(--surface2); border: 1px solid var(--border); color: var(--text); padding: 12px 36px; border-radius: 50px; font-size: 13px; font-weight: 600; cursor: pointer; font-family: 'DM Sans', sans-serif; transition: all 0.2s; }
+.load-more-btn:hover { border-color: var(--pink); color: var(--pink); }
+
+/* ---- SPINNER ---- */
+.spinner-wrap { display: flex; justify-content: center; align-items: center; padding: 60px; }
+.spinner { width: 36px; height: 36px; border: 3px solid var(--surface2); border-top-color: var(--pink); border-radius: 50%; animation: spin 0.7s linear infinite; }
+@keyframes spin { to { transform: rotate(360deg); } }
+
+/* ---- FAB ---- */
+.fab { position: fixed; bottom: 90px; right: 16px; width: 48px; height: 48px; background: linear-gradient(135deg, var(--pink), var(--pink-dark)); border-radius: 50%; display: flex; align-items: center; justify-content: center; box-shadow: 0 4px 20px var(--pink-glow); z-index: 300; cursor: pointer; transition: all 0.2s; }
+.fab:active { transform: scale(0.9); }
+.fab i { color: white; font-size: 18px; transition: transform 0.3s; }
+.fab.spinning i { animation: spin 0.5s linear; }
+
+/* ---- PLAYER MODAL ---- */
+#player-modal { position: fixed; inset: 0; background: #000; z-index: 600; overflow-y: auto; display: none; padding-bottom: 80px; }
+.player-header { position: sticky; top: 0; background: rgba(0,0,0,0.95); z-index: 10; padding: 12px 16px; display: flex; align-items: center; gap: 12px; border-bottom: 1px solid var(--border); backdrop-filter: blur(10px); }
+.back-btn { width: 36px; height: 36px; background: var(--surface2); border-radius: 50%; display: flex; align-items: center; justify-content: center; cursor: pointer; color: var(--text); flex-shrink: 0; }
+.player-header-title { font-weight: 600; font-size: 14px; overflow: hidden; text-overflow: ellipsis; white-space: nowrap; flex: 1; }
+.player-fav-btn { background: var(--surface2); border: 1px solid var(--border); color: var(--text-muted); width: 36px; height: 36px; border-radius: 50%; display: flex; align-items: center; justify-content: center; cursor: pointer; flex-shrink: 0; transition: all 0.2s; font-size: 14px; }
+.player-fav-btn.fav-active { color: var(--pink); border-color: var(--pink); background: rgba(233,30,140,0.1); }
+.video-frame-wrap { width: 100%; aspect-ratio: 16/9; background: #000; position: relative; }
+#main-iframe { width: 100%; height: 100%; border: none; display: block; }
+.player-body { padding: 16px; }
+.player-title { font-family: 'Playfair Display', serif; font-size: 18px; font-weight: 700; line-height: 1.3; margin-bottom: 10px; }
+.player-meta { display: flex; flex-wrap: wrap; gap: 10px; margin-bottom: 16px; }
+.meta-chip { display: flex; align-items: center; gap: 5px; background: var(--surface2); padding: 6px 12px; border-radius: 50px; font-size: 12px; color: var(--text-muted); }
+.meta-chip i { color: var(--pink); font-size: 11px; }
+.tags-wrap { display: flex; flex-wrap: wrap; gap: 6px; margin-bottom: 20px; }
+.tag { padding: 4px 10px; background: var(--surface2); border: 1px solid var(--border); border-radius: 4px; font-size: 11px; color: var(--text-muted); cursor: pointer; transition: all 0.15s; }
+.tag:hover { color: var(--pink); border-color: var(--pink); }
+.section-divider { border: none; border-top: 1px solid var(--border); margin: 20px 0; }
+.related-grid { display: grid; grid-template-columns: repeat(2, 1fr); gap: 10px; }
+@media(min-width: 480px) { .related-grid { grid-template-columns: repeat(3, 1fr); } }
+
+/* ---- AUTH MODAL ---- */
+.modal-backdrop { position: fixed; inset: 0; background: rgba(0,0,0,0.85); z-index: 800; display: flex; align-items: center; justify-content: center; padding: 20px; backdrop-filter: blur(8px); }
+.modal-box { background: var(--surface); border: 1px solid var(--border); border-radius: 16px; width: 100%; max-width: 380px; padding: 28px; position: relative; }
+.modal-box h2 { font-family: 'Playfair Display', serif; font-size: 22px; font-weight: 700; margin-bottom: 6px; }
+.modal-box .sub { color: var(--text-muted); font-size: 13px; margin-bottom: 24px; }
+.modal-close { position: absolute; top: 16px; right: 16px; width: 30px; height: 30px; background: var(--surface2); border-radius: 50%; display: flex; align-items: center; justify-content: center; cursor: pointer; color: var(--text-muted); font-size: 13px; }
+.form-group { margin-bottom: 14px; }
+.form-label { font-size: 11px; font-weight: 600; text-transform: uppercase; letter-spacing: 0.8px; color: var(--text-muted); display: block; margin-bottom: 6px; }
+.form-input { width: 100%; background: var(--surface2); border: 1px solid var(--border); border-radius: 8px; padding: 11px 14px; color: var(--text); font-size: 14px; font-family: 'DM Sans', sans-serif; outline: none; transition: all 0.2s; }
+.form-input:focus { border-color: var(--pink); box-shadow: 0 0 0 3px var(--pink-glow); }
+.form-submit { width: 100%; background: linear-gradient(135deg, var(--pink), var(--pink-dark)); color: white; border: none; padding: 13px; border-radius: 8px; font-size: 14px; font-weight: 600; cursor: pointer; font-family: 'DM Sans', sans-serif; margin-top: 6px; transition: all 0.2s; }
+.form-submit:hover { box-shadow: 0 0 25px var(--pink-glow); }
+.form-error { color: #ff4466; font-size: 12px; margin-top: 6px; display: none; }
+.form-switch { text-align: center; margin-top: 16px; font-size: 13px; color: var(--text-muted); }
+.form-switch a { color: var(--pink); cursor: pointer; font-weight: 500; }
+
+/* ---- USER MENU ---- */
+.user-menu { position: fixed; top: 60px; right: 12px; background: var(--surface); border: 1px solid var(--border); border-radius: 12px; width: 220px; z-index: 500; overflow: hidden; box-shadow: 0 8px 30px rgba(0,0,0,0.5); }
+.user-menu-header { padding: 16px; border-bottom: 1px solid var(--border); }
+.user-menu-name { font-weight: 700; font-size: 15px; color: var(--text); }
+.user-menu-email { font-size: 11px; color: var(--text-muted); margin-top: 2px; }
+.menu-item { padding: 12px 16px; display: flex; align-items: center; gap: 10px; cursor: pointer; color: var(--text-muted); font-size: 13px; transition: all 0.15s; }
+.menu-item:hover { background: var(--surface2); color: var(--text); }
+.menu-item i { width: 16px; text-align: center; color: var(--pink); font-size: 13px; }
+.menu-item.danger { color: #ff4466; }
+.menu-item.danger i { color: #ff4466; }
+
+/* ---- TOAST ---- */
+#toast { position: fixed; bottom: 90px; left: 50%; transform: translateX(-50%) translateY(20px); background: var(--surface2); border: 1px solid var(--border); color: var(--text); padding: 10px 20px; border-radius: 50px; font-size: 13px; font-weight: 500; z-index: 9999; opacity: 0; transition: all 0.3s; pointer-events: none; white-space: nowrap; box-shadow: 0 4px 20px rgba(0,0,0,0.4); }
+#toast.show { opacity: 1; transform: translateX(-50%) translateY(0); }
+#toast.success i { color: #22c55e; }
+#toast.error i { color: #ff4466; }
+
+/* ---- EMPTY STATE ---- */
+.load-more { display: block; margin: 20px auto; background: var(--surface2); color: var(--text); border: 1px solid var(--border); padding: 10px 28px; border-radius: 50px; font-size: 13px; font-weight: 600; cursor: pointer; font-family: 'DM Sans', sans-serif; transition: all 0.2s; }
+.load-more:hover { border-color: var(--pink); color: var(--pink); }
+.empty-state { text-align: center; padding: 60px 20px; }
+.empty-state i { font-size: 48px; color: var(--text-dim); margin-bottom: 16px; }
+.empty-state h3 { font-size: 18px; font-weight: 700; color: var(--text-muted); margin-bottom: 8px; }
+.empty-state p { font-size: 13px; color: var(--text-dim); }
+
+/* ---- SKELETON SHIMMER ---- */
+@keyframes shimmer { 0% { background-position: -400px 0; } 100% { background-position: 400px 0; } }
+.thumb-wrap img { background: var(--surface2); }
+.thumb-wrap img.loading-img {
+    background: linear-gradient(90deg, var(--surface2) 25%, #222 50%, var(--surface2) 75%);
+    background-size: 400px 100%;
+    animation: shimmer 1.4s ease infinite;
+}
+
+/* ---- INFINITE SCROLL SENTINEL ---- */
+#scroll-sentinel { height: 1px; width: 100%; }
+.infinite-spinner { display: flex; justify-content: center; align-items: center; padding: 30px; }
+.infinite-spinner .spinner { width: 28px; height: 28px; border-width: 2px; }
+
+/* ---- PROGRESS BAR ---- */
+#progress-bar { position: fixed; top: 0; left: 0; height: 2px; background: linear-gradient(90deg, var(--pink), #ff6bb0); z-index: 99999; width: 0; transition: width 0.3s; }
+
+/* ---- BOTTOM NAV ---- */
+.bottom-nav { position: fixed; bottom: 0; left: 0; right: 0; background: rgba(8,8,8,0.97); border-top: 1px solid var(--border); display: flex; z-index: 400; backdrop-filter: blur(20px); }
+.nav-item { flex: 1; display: flex; flex-direction: column; align-items: center; justify-content: center; padding: 10px 4px 12px; cursor: pointer; color: var(--text-muted); font-size: 10px; gap: 4px; transition: color 0.2s; }
+.nav-item i { font-size: 18px; }
+.nav-item.active { color: var(--pink); }
+.nav-item span { font-weight: 500; }
+
+/* ---- TABS ---- */
+#section-main, #section-favorites, #section-history { display: none; }
+#section-main.active-section, #section-favorites.active-section, #section-history.active-section { display: block; }
+
+/* ---- NO RESULTS ---- */
+.no-results { text-align: center; padding: 80px 20px; }
+.no-results i { font-size: 40px; color: var(--text-dim); margin-bottom: 16px; display: block; }
+.no-results p { color: var(--text-muted); font-size: 14px; }
+"""
+
+APP_JS = r"""
 // ===== STATE =====
 let state = {
     currentCategory: 'korean',
@@ -716,9 +3021,11 @@ let state = {
     currentPage: 1,
     totalVideos: 0,
     allVideos: [],
+    seenIds: new Set(),
     currentVideo: null,
     user: null,
     favorites: new Set(),
+    favCursor: null,
     isLoading: false,
     hasMore: true,
     searchTimeout: null
@@ -765,9 +3072,7 @@ function enterSite() {
 // ===== INIT =====
 async function init() {
     checkAge();
-    await checkSession();
-    fetchTrending();
-    fetchVideos(true);
+    await loadStartup();
     setupInfiniteScroll();
     window.addEventListener('scroll', onScroll);
     window.addEventListener('hashchange', onHashChange);
@@ -792,23 +3097,68 @@ function scrollToTop() {
 }
 
 // ===== SESSION =====
+// Session, favorites, trending and the first feed pages: whatever the server
+// inlined into the page, then one batch round trip for anything missing
+async function loadStartup() {
+    const boot = JSON.parse(document.getElementById('bootstrap').textContent) || {};
+    const feedPath = `/api/data?q=${encodeURIComponent(state.currentCategory)}&page=1&order=${state.currentOrder}&per_page=24&pages=${STREAM_PAGES}`;
+    const wanted = [];
+    if (!boot.me) wanted.push({ id: 'me', path: '/api/me' }, { id: 'favorites', path: '/api/favorites?ids_only=1' });
+    if (!boot.trending) wanted.push({ id: 'trending', path: '/api/trending' });
+    if (!boot.feed) wanted.push({ id: 'feed', path: feedPath });
+    let responses = {};
+    if (wanted.length) {
+        try {
+            const r = await fetch('/api/batch', {
+                method: 'POST', headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ requests: wanted })
+            });
+            responses = (await r.json()).responses;
+        } catch(e) {}
+    }
+    // Anything neither inlined nor batched falls back to its own request
+    const ok = id => responses[id] && responses[id].status === 200 ? responses[id].body : null;
+    const me = boot.me || ok('me');
+    if (!me) {
+        await checkSession();
+    } else if (applySession(me)) {
+        const favs = boot.favorite_ids || (ok('favorites') ? ok('favorites').ids : null);
+        if (favs) state.favorites = new Set(favs);
+        else await loadFavoriteIds();
+    }
+    const feed = boot.feed || ok('feed');
+    if (feed) {
+        resetFeed();
+        state.totalVideos = feed.total || 0;
+        appendFeed(feed.videos || []);
+        finishFeed(1, feed.last_page, true);
+    } else {
+        fetchVideos(true);
+    }
+    const trending = boot.trending || (ok('trending') ? ok('trending').videos : null);
+    if (trending) renderTrending(trending);
+    else fetchTrending();
+}
+
+function applySession(data) {
+    if (!data || !data.logged_in) return false;
+    state.user = data;
+    renderAuthArea(data);
+    return true;
+}
+
 async function checkSession() {
     try {
         const r = await fetch('/api/me');
-        const data = await r.json();
-        if (data.logged_in) {
-            state.user = data;
-            renderAuthArea(data);
-            await loadFavoriteIds();
-        }
+        if (applySession(await r.json())) await loadFavoriteIds();
     } catch(e) {}
 }
 
 async function loadFavoriteIds() {
     try {
-        const r = await fetch('/api/favorites');
+        const r = await fetch('/api/favorites?ids_only=1');
         const data = await r.json();
-        state.favorites = new Set((data.videos || []).map(v => v.id));
+        state.favorites = new Set(data.ids || []);
     } catch(e) {}
 }
 
@@ -915,30 +3265,74 @@ function focusSearch() {
 }
 
 // ===== FETCH VIDEOS =====
+const STREAM_PAGES = 2;
+
+// Calls onMessage for each JSON line of an NDJSON response as it arrives.
+async function readNdjson(response, onMessage) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buf = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buf += decoder.decode(value, { stream: true });
+        let nl;
+        while ((nl = buf.indexOf('\n')) >= 0) {
+            const line = buf.slice(0, nl).trim();
+            buf = buf.slice(nl + 1);
+            if (line) onMessage(JSON.parse(line));
+        }
+    }
+    if (buf.trim()) onMessage(JSON.parse(buf));
+}
+
+function resetFeed() {
+    state.currentPage = 1;
+    state.totalVideos = 0;
+    state.allVideos = [];
+    state.seenIds = new Set();
+    document.getElementById('main-grid').innerHTML = '';
+    document.getElementById('trending-section').style.display = 'none';
+}
+
+// Renders the videos not already on the grid; returns how many were new
+function appendFeed(videos) {
+    const fresh = videos.filter(v => !state.seenIds.has(v.id));
+    if (!fresh.length) return 0;
+    fresh.forEach(v => state.seenIds.add(v.id));
+    state.allVideos = state.allVideos.concat(fresh);
+    renderGrid(fresh, true);
+    return fresh.length;
+}
+
+function finishFeed(startPage, lastPage, reset) {
+    if (reset && !state.allVideos.length) renderGrid([], false);
+    document.getElementById('results-count').textContent = state.totalVideos ? `${formatNum(state.totalVideos)} videos` : '';
+    const titleMap = { latest: 'Latest Videos', 'top-weekly': 'Hot This Week', 'top-monthly': 'Hot This Month', 'top-rated': 'Top Rated', 'most-popular': 'Most Popular' };
+    document.getElementById('grid-title').textContent = `${state.currentCategory.charAt(0).toUpperCase() + state.currentCategory.slice(1)} — ${titleMap[state.currentOrder] || 'Videos'}`;
+    // Next infinite-scroll step resumes after the last contiguous page
+    state.currentPage = lastPage;
+    state.hasMore = lastPage >= startPage && state.allVideos.length < state.totalVideos;
+}
+
 async function fetchVideos(reset = false) {
     if (state.isLoading) return;
     state.isLoading = true;
-    if (reset) {
-        state.currentPage = 1;
-        state.allVideos = [];
-        document.getElementById('main-grid').innerHTML = '';
-        document.getElementById('trending-section').style.display = 'none';
-    }
+    if (reset) resetFeed();
     startProgress();
     const spinner = document.getElementById(reset ? 'loading-spinner' : 'infinite-spinner');
     spinner.classList.remove('hidden');
+    const startPage = state.currentPage;
+    let lastPage = startPage - 1;
     try {
-        const r = await fetch(`/api/data?q=${encodeURIComponent(state.currentCategory)}&page=${state.currentPage}&order=${state.currentOrder}&per_page=24`);
-        const data = await r.json();
-        state.totalVideos = data.total || 0;
-        const videos = data.videos || [];
-        state.allVideos = reset ? videos : [...state.allVideos, ...videos];
-        document.getElementById('results-count').textContent = state.totalVideos ? `${formatNum(state.totalVideos)} videos` : '';
-        const titleMap = { latest: 'Latest Videos', 'top-weekly': 'Hot This Week', 'top-monthly': 'Hot This Month', 'top-rated': 'Top Rated', 'most-popular': 'Most Popular' };
-        document.getElementById('grid-title').textContent = `${state.currentCategory.charAt(0).toUpperCase() + state.currentCategory.slice(1)} — ${titleMap[state.currentOrder] || 'Videos'}`;
-        renderGrid(videos, !reset);
-        // Update hasMore flag for infinite scroll
-        state.hasMore = state.allVideos.length < state.totalVideos;
+        const r = await fetch(`/api/data/stream?q=${encodeURIComponent(state.currentCategory)}&page=${startPage}&order=${state.currentOrder}&per_page=24&pages=${STREAM_PAGES}`);
+        // Paint each page's cards as soon as its line arrives
+        await readNdjson(r, msg => {
+            state.totalVideos = Math.max(state.totalVideos, msg.total || 0);
+            if (msg.done) { lastPage = msg.last_page; return; }
+            if (appendFeed(msg.videos || [])) spinner.classList.add('hidden');
+        });
+        finishFeed(startPage, lastPage, reset);
     } catch(e) { console.error(e); showToast('Failed to load videos.', 'error'); }
     spinner.classList.add('hidden');
     endProgress();
@@ -1176,17 +3570,25 @@ async function togglePlayerFav() {
     } catch(e) { showToast('Error.', 'error'); }
 }
 
-async function loadFavoritesPage() {
+const FAV_PAGE_SIZE = 48;
+
+async function loadFavoritesPage(more = false) {
     const grid = document.getElementById('fav-grid');
     const empty = document.getElementById('fav-empty');
+    const moreBtn = document.getElementById('fav-more');
+    moreBtn.classList.add('hidden');
     if (!state.user) { grid.innerHTML = ''; empty.classList.remove('hidden'); return; }
+    if (!more) state.favCursor = null;
     try {
-        const r = await fetch('/api/favorites');
+        const cursor = state.favCursor != null ? `&cursor=${state.favCursor}` : '';
+        const r = await fetch(`/api/favorites?limit=${FAV_PAGE_SIZE}${cursor}`);
         const data = await r.json();
         const favs = data.videos || [];
-        if (!favs.length) { grid.innerHTML = ''; empty.classList.remove('hidden'); return; }
+        state.favCursor = data.next_cursor;
+        if (!favs.length && !more) { grid.innerHTML = ''; empty.classList.remove('hidden'); return; }
         empty.classList.add('hidden');
-        grid.innerHTML = favs.map(v => `
+        if (state.favCursor != null) moreBtn.classList.remove('hidden');
+        const html = favs.map(v => `
             <div class="video-card" onclick="openPlayer(${JSON.stringify(v).replace(/'/g,"&apos;").replace(/"/g,'&quot;')})">
                 <div class="thumb-wrap">
                     <img src="${v.poster}" loading="lazy">
@@ -1199,6 +3601,8 @@ async function loadFavoritesPage() {
                 </div>
             </div>
         `).join('');
+        if (more) grid.insertAdjacentHTML('beforeend', html);
+        else grid.innerHTML = html;
     } catch(e) { console.error(e); }
 }
 
@@ -1285,11 +3689,12 @@ function toggleTheme() {
 
 // ===== START =====
 window.addEventListener('DOMContentLoaded', init);
-</script>
-</body>
-</html>
 """
 
+# Rendered once per worker; the stylesheet and script are served under
+# content-hashed names so browsers can cache them forever.
+index_page = build_frontend()
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 8000))
     app.run(host='0.0.0.0', port=port, threaded=True)
@@ -0,0 +1,375 @@
+# Micro-benchmarks against a local fake upstream. Run: python bench.py [name ...]
+import json, os, random, sys, tempfile, threading, time, tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+import app
+
+FAKE_PAGE = json.dumps({
+    'total_count': 5000,
+    'videos': [{
+        'id': f'vid{i}', 'title': f'Video {i}', 'keywords': 'a, b, c, d, e', 'rate': '4.25',
+        'views': i * 100, 'length_min': '12:30', 'embed': f'https://example.com/embed/vid{i}/',
+        'url': f'https://example.com/video/vid{i}/', 'added': '2024-01-01 00:00:00', 'is_vr': False,
+        'thumbs': [{'src': f'https://example.com/thumbs/vid{i}/{n}.jpg'} for n in range(15)],
+        'default_thumb': {'src': f'https://example.com/thumbs/vid{i}/0.jpg'},
+    } for i in range(24)],
+}).encode()
+
+class FakeUpstream:
+    # delay(n) gives the seconds to stall before answering the nth request.
+    def __init__(self, delay=None):
+        outer = self
+        self.connections = 0
+        self.requests = 0
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def do_GET(self):
+                outer.requests += 1
+                if delay is not None:
+                    time.sleep(delay(outer.requests))
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(FAKE_PAGE)))
+                self.end_headers()
+                self.wfile.write(FAKE_PAGE)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+
+            def get_request(self):
+                outer.connections += 1
+                return super().get_request()
+
+            # Clients that hit a deadline hang up mid-response; that's expected.
+            def handle_error(self, request, client_address):
+                pass
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}/api/v2/video/search/'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def reset(self):
+        self.connections = self.requests = 0
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def _timed(n, fn):
+    start = time.perf_counter()
+    for i in range(n):
+        fn(i)
+    return (time.perf_counter() - start) / n * 1e6
+
+def bench_pool(n=500):
+    fake = FakeUpstream()
+    client = app.UpstreamClient(base_url=fake.url)
+    url = f'{fake.url}?query=korean&per_page=24&page=1&order=latest&format=json&thumbsize=big'
+    try:
+        fake.reset()
+        bare = _timed(n, lambda i: requests.get(url, headers=app.HEADERS, timeout=6).json())
+        bare_conns = fake.connections
+        fake.reset()
+        pooled = _timed(n, lambda i: client.search('korean', 1))
+        pooled_conns = fake.connections
+    finally:
+        fake.close()
+    print(f'pool: {n} sequential upstream calls')
+    print(f'  bare requests.get  {bare:8.1f} us/req  {bare_conns} connections')
+    print(f'  UpstreamClient     {pooled:8.1f} us/req  {pooled_conns} connections')
+    print(f'  saved per request  {bare - pooled:8.1f} us  (TCP only; TLS upstream saves a handshake on top)')
+
+def bench_favorites(n=10000, ops=2000):
+    videos = [{'id': f'vid{i}', 'title': f'Video {i}'} for i in range(n)]
+    rng = random.Random(1)
+    probes = [rng.choice(videos) for _ in range(ops)]
+
+    # The list-of-dicts store this replaced, newest first.
+    def list_toggle(favs, video):
+        existing = next((i for i, f in enumerate(favs) if f['id'] == video['id']), None)
+        if existing is not None:
+            favs.pop(existing)
+        else:
+            favs.insert(0, video)
+
+    favs = list(reversed(videos))
+    old_check = _timed(ops, lambda i: any(f['id'] == probes[i]['id'] for f in favs))
+    old_toggle = _timed(ops, lambda i: list_toggle(favs, probes[i]))
+    old_page = _timed(ops, lambda i: favs[:48])
+
+    store = app.FavoriteList()
+    for v in videos:
+        store.add(v['id'])
+
+    def store_toggle(vid_id):
+        if not store.remove(vid_id):
+            store.add(vid_id)
+
+    new_check = _timed(ops, lambda i: probes[i]['id'] in store)
+    new_toggle = _timed(ops, lambda i: store_toggle(probes[i]['id']))
+    new_page = _timed(ops, lambda i: store.page(None, 48))
+
+    print(f'favorites: {n} per user, {ops} random ops')
+    print(f'                   list         FavoriteList')
+    print(f'  is_favorite  {old_check:8.2f} us  {new_check:8.2f} us')
+    print(f'  toggle       {old_toggle:8.2f} us  {new_toggle:8.2f} us')
+    print(f'  page of 48   {old_page:8.2f} us  {new_page:8.2f} us')
+
+def _traced(build):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return kept, used
+
+def bench_catalog(users=1000, per_user=100, popular=500):
+    raw = json.loads(FAKE_PAGE)['videos'][0]
+    pool = [app.format_video(dict(raw, id=f'vid{i}', embed=f'https://example.com/embed/vid{i}/'))
+            for i in range(popular)]
+    rng = random.Random(1)
+    picks = [rng.sample(pool, per_user) for _ in range(users)]
+
+    # Before: every user list held its own decoded copy of each video dict.
+    def per_user_dicts():
+        return {f'user{u}': [json.loads(json.dumps(v.to_dict())) for v in videos] for u, videos in enumerate(picks)}
+
+    # After: the pages were fetched into the response cache first, as in the
+    # app; each favorite is POSTed as a client copy and the store interns the
+    # upstream copy from the cache, keeping only ids per user.
+    def shared_catalog():
+        store = app.MemoryStore()
+        for u, videos in enumerate(picks):
+            store.add_user(f'user{u}', {})
+            for v in videos:
+                store.toggle_favorite(f'user{u}', app.Video.from_client(json.loads(json.dumps(v.to_dict()))))
+        return store
+
+    saved = app.response_cache
+    app.response_cache = app.ResponseCache(app.CACHE_MAX_ENTRIES, app.CACHE_MAX_BYTES, None)
+    try:
+        for p in range(0, popular, 24):
+            app.response_cache.put(('bench', p // 24 + 1, 'latest', 24), (pool[p:p + 24], popular), 3600)
+        _, old = _traced(per_user_dicts)
+        store, new = _traced(shared_catalog)
+    finally:
+        app.response_cache = saved
+    print(f'catalog: {users} users x {per_user} favorites from {popular} popular videos')
+    print(f'  per-user dicts   {old / users / 1024:8.1f} KiB/user')
+    print(f'  shared catalog   {new / users / 1024:8.1f} KiB/user  ({len(store._catalog)} videos interned, '
+          f'{sum(map(len, store._drafts.values()))} drafts)')
+
+def bench_format(n=300):
+    base = json.loads(FAKE_PAGE)['videos'][0]
+
+    # The per-video dict formatter and json.dumps path this replaced.
+    def old_format(v):
+        thumbs = v.get('thumbs', [])
+        poster = thumbs[4]['src'] if len(thumbs) > 4 else v.get('default_thumb', {}).get('src', '')
+        return {
+            "id": v.get('id', ''), "title": v.get('title', 'Untitled'), "poster": poster,
+            "big_thumb": thumbs[-1]['src'] if thumbs else poster,
+            "rating": round(float(v.get('rate', 0)), 1), "views": v.get('views', 0),
+            "categories": [k.strip() for k in v.get('keywords', '').split(',')[:4]],
+            "duration": v.get('length_min', '0'), "embed_url": v.get('embed', ''),
+            "video_url": v.get('url', ''), "added": v.get('added', ''), "is_vr": v.get('is_vr', False)
+        }
+
+    print(f'format: upstream page -> response body, {n} rounds'
+          f' ({"orjson" if app.orjson else "stdlib json"})')
+    for size in (24, 100):
+        raw = [dict(base, id=f'vid{i}', embed=f'https://example.com/embed/vid{i}/') for i in range(size)]
+        old_fmt = _timed(n, lambda i: [old_format(v) for v in raw])
+        videos = [old_format(v) for v in raw]
+        old_dump = _timed(n, lambda i: json.dumps({"videos": videos, "total": 5000, "page": 1}).encode())
+        new_fmt = _timed(n, lambda i: app.format_page(raw))
+        page = app.format_page(raw)
+        new_dump = _timed(n, lambda i: app.app.json.dumps_bytes(page))
+        raw_bytes = app.app.json.dumps_bytes(page)
+        splice = _timed(n, lambda i: b'{"videos":%s,"total":%d,"page":%d}' % (raw_bytes, 5000, 1))
+        _, old_mem = _traced(lambda: [old_format(v) for v in raw])
+        _, new_mem = _traced(lambda: app.format_page(raw))
+        print(f'  {size} videos            dicts+json    Video+fast')
+        print(f'    format         {old_fmt:9.1f} us  {new_fmt:9.1f} us')
+        print(f'    serialize      {old_dump:9.1f} us  {new_dump:9.1f} us  (cached splice {splice:.1f} us)')
+        print(f'    formatted size {old_mem / 1024:9.1f} KiB {new_mem / 1024:9.1f} KiB')
+
+def bench_store(n=1000, ops=1000):
+    videos = [app.Video(f'vid{i}', f'Video {i}') for i in range(n)]
+    rng = random.Random(1)
+    probes = [rng.choice(videos) for _ in range(ops)]
+    path = tempfile.mktemp(suffix='.db')
+    stores = [('memory', app.MemoryStore()), ('sqlite', app.SQLiteStore(path))]
+    print(f'store: {n} favorites, {ops} random ops')
+    print(f'                   memory       sqlite (WAL)')
+    rows = {}
+    try:
+        for name, store in stores:
+            store.add_user('bench', {'email': '', 'password': '', 'created': 0, 'avatar': 'B'})
+            for v in videos:
+                store.toggle_favorite('bench', v)
+            rows.setdefault('toggle', []).append(_timed(ops, lambda i: store.toggle_favorite('bench', probes[i])))
+            rows.setdefault('is_favorite', []).append(_timed(ops, lambda i: store.favorited('bench', (probes[i]['id'],))))
+            rows.setdefault('page of 48', []).append(_timed(ops, lambda i: store.favorites_page('bench', None, 48)))
+            rows.setdefault('history add', []).append(_timed(ops, lambda i: store.add_history('bench', probes[i])))
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    for label, (mem, sql) in rows.items():
+        print(f'  {label:12} {mem:8.2f} us  {sql:8.2f} us')
+
+def bench_shared(n=300):
+    fake = FakeUpstream()
+    path = tempfile.mktemp(suffix='.db')
+    client = app.UpstreamClient(base_url=fake.url)
+    shared = app.SharedCache(path)
+
+    def loader():
+        videos, total = client.search('korean', 1)
+        return app.format_page(videos), total
+
+    # A fresh L1 per call is a worker that has never seen the key.
+    def cold_worker(i, shared):
+        cache = app.ResponseCache(10, 1 << 20, client.executor, shared)
+        cache.get(('korean', 1, 'latest', 24), loader, 60)
+
+    try:
+        upstream_only = _timed(n, lambda i: cold_worker(i, None))
+        cold_worker(0, shared)
+        fake.reset()
+        from_l2 = _timed(n, lambda i: cold_worker(i, shared))
+        upstream_calls = fake.requests
+    finally:
+        fake.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+    print(f'shared: {n} L1 misses on a 24-video page')
+    print(f'  upstream fetch   {upstream_only:8.1f} us/miss')
+    print(f'  L2 hit           {from_l2:8.1f} us/miss  ({upstream_calls} upstream calls, {shared.hits} L2 hits)')
+
+def bench_metrics(n=100000, workers=8):
+    m = app.Metrics(tempfile.mkdtemp())
+    m.counter('bench_total', '')
+    m.histogram('bench_seconds', '')
+    labels = (('route', '/api/data'),)
+    inc = _timed(n, lambda i: m.inc('bench_total', labels))
+    observe = _timed(n, lambda i: m.observe('bench_seconds', labels, (i % 1000) / 1000))
+    # Fake the other workers' files so the scrape merges a full host.
+    state = m.state()
+    for pid in range(1, workers):
+        with open(os.path.join(m.directory, f'{1 << 22 | pid}.json'), 'w') as f:
+            json.dump(dict(state, pid=1 << 22 | pid), f)
+    render = _timed(100, lambda i: m.render())
+    for name in os.listdir(m.directory):
+        os.remove(os.path.join(m.directory, name))
+    os.rmdir(m.directory)
+    print(f'metrics: per-call cost')
+    print(f'  counter inc      {inc * 1000:8.0f} ns')
+    print(f'  histogram obs    {observe * 1000:8.0f} ns')
+    print(f'  /metrics render  {render:8.0f} us  ({workers} worker files)')
+
+def _percentiles(samples):
+    s = sorted(samples)
+    return {q: s[min(len(s) - 1, int(q / 100 * len(s)))] * 1000 for q in (50, 95, 99, 100)}
+
+def bench_hedge(n=200, spike_every=20, spike=0.5, base=0.01, deadline=0.25):
+    fake = FakeUpstream(delay=lambda i: spike if i % spike_every == 0 else base)
+
+    def run(client, budget=None):
+        times, failed = [], 0
+        for i in range(n):
+            token = app.request_deadline.set(time.monotonic() + budget if budget else None)
+            start = time.perf_counter()
+            try:
+                client.search('korean', 1)
+            except app.UpstreamError:
+                failed += 1
+            finally:
+                app.request_deadline.reset(token)
+            times.append(time.perf_counter() - start)
+        return _percentiles(times), failed
+
+    plain = app.UpstreamClient(base_url=fake.url)
+    hedged = app.UpstreamClient(base_url=fake.url, hedge=True)
+    try:
+        rows = [('no deadline', *run(plain)),
+                (f'{deadline * 1000:.0f} ms deadline', *run(plain, deadline)),
+                ('hedged', *run(hedged)),
+                (f'hedged + deadline', *run(hedged, deadline))]
+    finally:
+        fake.close()
+    print(f'hedge: {n} calls, every {spike_every}th upstream response stalls {spike * 1000:.0f} ms, others {base * 1000:.0f} ms')
+    print(f'                         p50       p95       p99       max   failed')
+    for label, p, failed in rows:
+        print(f'  {label:18} {p[50]:6.1f} ms {p[95]:6.1f} ms {p[99]:6.1f} ms {p[100]:6.1f} ms  {failed}')
+    print(f'  hedges fired {hedged.hedged}, won by the duplicate {hedged.hedge_wins}')
+
+def bench_breaker(n=40, threads=8, stall=1.0, read_timeout=0.2, warmup=40):
+    stalled = [False]
+    fake = FakeUpstream(delay=lambda i: stall if stalled[0] else 0)
+
+    # A healthy spell first, so the client knows upstream's usual latency.
+    def run(label, client, budget=None):
+        stalled[0] = False
+        for _ in range(warmup):
+            client.search('korean', 1)
+        stalled[0] = True
+
+        def call(_):
+            token = app.request_deadline.set(time.monotonic() + budget if budget else None)
+            start = time.perf_counter()
+            try:
+                client.search('korean', 1)
+            except app.UpstreamError:
+                pass
+            finally:
+                app.request_deadline.reset(token)
+            return time.perf_counter() - start
+        start = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            times = list(pool.map(call, range(n)))
+        reached = client.calls - warmup - client.breaker.rejected - client.limiter.rejected
+        return label, _percentiles(times), time.perf_counter() - start, reached, client
+
+    kwargs = dict(base_url=fake.url, read_timeout=read_timeout)
+    # Default REQUEST_DEADLINE / UPSTREAM_READ_TIMEOUT ratio: every live call has its timeout clipped
+    budget = read_timeout * app.REQUEST_DEADLINE / app.UPSTREAM_READ_TIMEOUT
+    try:
+        rows = [run('no breaker', app.UpstreamClient(breaker=app.CircuitBreaker(failures=n + 1),
+                                                     limiter=app.AIMDLimiter(initial=threads, minimum=threads), **kwargs)),
+                run('breaker + limit', app.UpstreamClient(**kwargs)),
+                run(f'  {budget * 1000:.0f} ms deadline', app.UpstreamClient(**kwargs), budget)]
+    finally:
+        fake.close()
+    print(f'breaker: {n} calls from {threads} threads while upstream stalls {stall * 1000:.0f} ms, read timeout {read_timeout * 1000:.0f} ms')
+    print(f'                        p50       p95       max     total  upstream  breaker  limit')
+    for label, p, total, reached, client in rows:
+        print(f'  {label:17} {p[50]:6.1f} ms {p[95]:6.1f} ms {p[100]:6.1f} ms {total:6.2f} s  {reached:8}  '
+              f'{client.breaker.state:7}  {client.limiter.limit:5.1f}')
+
+BENCHES = {
+    'pool': bench_pool,
+    'favorites': bench_favorites,
+    'catalog': bench_catalog,
+    'format': bench_format,
+    'store': bench_store,
+    'shared': bench_shared,
+    'metrics': bench_metrics,
+    'hedge': bench_hedge,
+    'breaker': bench_breaker,
+}
+
+if __name__ == '__main__':
+    for name in sys.argv[1:] or BENCHES:
+        BENCHES[name]()
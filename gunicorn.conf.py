@@ -0,0 +1,12 @@
+# Read by gunicorn from the working directory.
+import glob
+import os
+
+
+# Worker metric files left by an earlier run would be added to this run's
+# counters. Same default as METRICS_DIR in app.py.
+def on_starting(server):
+    directory = os.environ.get('METRICS_DIR', '/tmp/velvet-metrics')
+    if directory:
+        for path in glob.glob(os.path.join(directory, '*.json')):
+            os.remove(path)
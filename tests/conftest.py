@@ -0,0 +1,6 @@
+import os
+import sys
+
+# No background warming and no files outside the test's tmp_path.
+os.environ.update(WARM_ENABLED='0', STORE_BACKEND='memory', CACHE_SHARED_PATH='', CACHE_SNAPSHOT_PATH='', METRICS_DIR='')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
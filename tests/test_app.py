@@ -0,0 +1,255 @@
+import pytest
+
+import app as velvet
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, monkeypatch, tmp_path):
+    s = velvet.MemoryStore() if request.param == 'memory' else velvet.SQLiteStore(str(tmp_path / 'velvet.db'))
+    monkeypatch.setattr(velvet, 'store', s)
+    return s
+
+
+def login(name):
+    client = velvet.app.test_client()
+    resp = client.post('/api/register', json={'username': name, 'password': 'secret1', 'email': f'{name}@example.com'})
+    assert resp.status_code == 200
+    return client
+
+
+def test_favorites_keep_client_copies_private(store):
+    alice, bob = login('alice'), login('bob')
+    alice.post('/api/favorites', json={'video': {
+        'id': 'vid7', 'poster': 'x" onerror="alert(document.cookie)', 'embed_url': 'javascript:alert(1)'}})
+    bob.post('/api/favorites', json={'video': {
+        'id': 'vid7', 'title': 'Video 7', 'poster': 'https://example.com/7.jpg', 'embed_url': 'https://example.com/embed/7/'}})
+
+    [seen_by_bob] = bob.get('/api/favorites').get_json()['videos']
+    assert seen_by_bob['title'] == 'Video 7'
+    assert seen_by_bob['poster'] == 'https://example.com/7.jpg'
+    [seen_by_alice] = alice.get('/api/favorites').get_json()['videos']
+    assert seen_by_alice['poster'] == '' and seen_by_alice['embed_url'] == ''
+
+
+def test_upstream_copy_replaces_client_copies(store):
+    alice, bob = login('alice'), login('bob')
+    for client in (alice, bob):
+        client.post('/api/favorites', json={'video': {'id': 'vid7', 'title': 'Sent by a client'}})
+        client.post('/api/history', json={'video': {'id': 'vid7', 'title': 'Sent by a client'}})
+    written = store.refresh([velvet.Video('vid7', 'From upstream', embed_url='https://example.com/embed/7/')])
+    if written is not None:
+        written.result()
+
+    for client in (alice, bob):
+        assert [v['title'] for v in client.get('/api/favorites').get_json()['videos']] == ['From upstream']
+        assert [v['title'] for v in client.get('/api/history').get_json()['videos']] == ['From upstream']
+
+
+def test_favorite_rejects_unusable_id(store):
+    alice = login('alice')
+    resp = alice.post('/api/favorites', json={'video': {'id': "x');alert(1);('"}})
+    assert resp.status_code == 400
+    assert alice.get('/api/favorites').get_json()['videos'] == []
+
+
+def test_sqlite_refresh_writes_only_changed_rows(tmp_path, monkeypatch):
+    store = velvet.SQLiteStore(str(tmp_path / 'velvet.db'))
+    store.add_user('alice', {'email': '', 'password': '', 'created': 0, 'avatar': 'A'})
+    store.toggle_favorite('alice', velvet.Video('vid7'))
+    page = [velvet.Video('vid7', 'From upstream'), velvet.Video('vid8', 'Not saved')]
+    store.refresh(page).result()
+    monkeypatch.setattr(store, '_write', lambda: pytest.fail('unchanged rows rewritten'))
+    store.refresh(page).result()
+    assert [v.title for v in store.favorites_page('alice')[0]] == ['From upstream']
+
+
+def test_batch_leaves_outer_request_state_alone(store, monkeypatch):
+    monkeypatch.setattr(velvet.profiler, 'sample_rate', 1)
+    monkeypatch.setattr(velvet, 'fetch_single_page', lambda *args: ([], 0))
+    alice = login('alice')
+    resp = alice.post('/api/batch', json={'requests': [
+        {'id': 'me', 'path': '/api/me'}, {'id': 'favorites', 'path': '/api/favorites?ids_only=1'},
+        {'id': 'history', 'path': '/api/history'}, {'id': 'feed', 'path': f'/api/data?q=batch-{store.epoch}'}]})
+    assert resp.status_code == 200
+    assert {k: v['status'] for k, v in resp.get_json()['responses'].items()} == {
+        'me': 200, 'favorites': 200, 'history': 200, 'feed': 200}
+    assert 'upstream;dur=' in resp.headers['Server-Timing']
+    assert velvet.http_inflight == 0
+
+
+@pytest.mark.parametrize('subrequests', [['/api/me'], [{'path': 5}], [None]])
+def test_batch_rejects_malformed_requests(subrequests):
+    resp = velvet.app.test_client().post('/api/batch', json={'requests': subrequests})
+    assert resp.status_code == 400
+
+
+def test_profiler_end_is_idempotent():
+    profiler = velvet.Profiler(sample_rate=1, stack_interval_ms=0)
+    prof = profiler.begin('/api/me')
+    assert prof is not None
+    profiler.end('/api/me', prof)
+    profiler.end('/api/me', prof)
+    assert profiler.profiled == 1
+    profiler.end('/api/me', profiler.begin('/api/me'))
+    assert profiler.profiled == 2
+
+
+def test_index_serves_precompressed_shell_by_default():
+    resp = velvet.app.test_client().get('/', headers={'Accept-Encoding': 'gzip'})
+    assert resp.status_code == 200
+    assert resp.headers['Content-Encoding'] == 'gzip'
+    assert resp.get_data() == velvet.index_page.encoded['gzip']
+
+
+def test_warmers_share_refreshes_through_l2(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(velvet, 'fetch_single_page', lambda *args: calls.append(args) or ([], 0))
+    shared = velvet.SharedCache(str(tmp_path / 'cache.db'))
+    for worker in range(2):
+        monkeypatch.setattr(velvet, 'response_cache', velvet.ResponseCache(1000, 1 << 24, None, shared))
+        velvet.CacheWarmer().warm()
+        assert len(velvet.response_cache) == len(list(velvet.warmer.jobs()))
+    assert len(calls) == len(list(velvet.warmer.jobs()))
+
+
+def test_snapshot_saves_merge_across_workers(tmp_path):
+    path = str(tmp_path / 'cache.snapshot')
+    for worker in range(2):
+        cache = velvet.ResponseCache(100, 1 << 20, None)
+        cache.put(('shared', 1, 'latest', 24), ([velvet.Video(f'w{worker}')], worker + 1), ttl=60 * (worker + 1))
+        cache.put((f'worker{worker}', 1, 'latest', 24), ([], 0), ttl=60)
+        cache.save_snapshot(path)
+
+    loaded = velvet.ResponseCache(100, 1 << 20, None, snapshot=velvet.CacheSnapshot.load(path))
+    assert len(loaded.snapshot) == 3
+    assert loaded.peek(('worker0', 1, 'latest', 24)) is not None
+    assert loaded.peek(('worker1', 1, 'latest', 24)) is not None
+    assert loaded.peek(('shared', 1, 'latest', 24)).value[0][0].id == 'w1'
+
+
+def test_metrics_retire_exited_workers(tmp_path):
+    import json
+    import subprocess
+    import sys
+
+    metrics = velvet.Metrics(str(tmp_path))
+    metrics.counter('velvet_test_total', 'Test counter.')
+    metrics.gauge('velvet_test_gauge', 'Test gauge.')
+    metrics.inc('velvet_test_total', value=2)
+    for _ in range(2):
+        exited = subprocess.Popen([sys.executable, '-c', ''])
+        exited.wait()
+        (tmp_path / f'{exited.pid}.json').write_text(json.dumps({
+            "pid": exited.pid, "counters": [['velvet_test_total', [], 3]],
+            "gauges": [['velvet_test_gauge', [], 7]], "histograms": []}))
+
+    for _ in range(2):
+        out = metrics.render()
+        assert 'velvet_test_total 8\n' in out
+        assert 'velvet_test_gauge' not in out
+    assert sorted(p.name for p in tmp_path.glob('*.json')) == sorted([f'{velvet.os.getpid()}.json', 'retired.json'])
+
+
+def _timing_out_client(monkeypatch, usual=None):
+    import requests
+
+    def timeout(url, timeout):
+        raise requests.Timeout('read timed out')
+
+    client = velvet.UpstreamClient(base_url='http://127.0.0.1:9')
+    monkeypatch.setattr(client.session, 'get', timeout)
+    for _ in range(client.latency.min_samples if usual else 0):
+        client.latency.record(usual)
+    return client
+
+
+def _search_with_budget(client, budget):
+    token = velvet.request_deadline.set(velvet.time.monotonic() + budget if budget else None)
+    try:
+        with pytest.raises(velvet.UpstreamError):
+            client.search('korean', 1)
+    finally:
+        velvet.request_deadline.reset(token)
+
+
+def test_too_short_deadline_timeouts_leave_breaker_and_limit_alone(monkeypatch):
+    client = _timing_out_client(monkeypatch, usual=0.15)
+    limit = client.limiter.limit
+    for _ in range(client.breaker.failures):
+        _search_with_budget(client, 0.05)
+    assert client.breaker.closed and client.limiter.limit == limit
+
+
+@pytest.mark.parametrize('usual', [None, 0.15])
+@pytest.mark.parametrize('budget', [velvet.REQUEST_DEADLINE, None])
+def test_stalled_upstream_opens_breaker(monkeypatch, usual, budget):
+    # With the default deadline every live call's timeout is clipped to it.
+    assert velvet.REQUEST_DEADLINE < velvet.UPSTREAM_READ_TIMEOUT
+    client = _timing_out_client(monkeypatch, usual)
+    limit = client.limiter.limit
+    for _ in range(client.breaker.failures):
+        _search_with_budget(client, budget)
+    assert client.breaker.state == velvet.CircuitBreaker.OPEN and client.limiter.limit < limit
+
+
+def test_collapsed_misses_share_one_entry(tmp_path, monkeypatch):
+    import threading
+    import time
+
+    monkeypatch.setattr(velvet, 'fetch_single_page', lambda *args: time.sleep(0.1) or ([], 0))
+    shared = velvet.SharedCache(str(tmp_path / 'cache.db'))
+    shared_puts = []
+    put = shared.put
+    monkeypatch.setattr(shared, 'put', lambda *args: shared_puts.append(args) or put(*args))
+    monkeypatch.setattr(velvet, 'response_cache', velvet.ResponseCache(100, 1 << 20, None, shared))
+    key = velvet.cache_key('collapsed', 1, 'latest', 24)
+    entries = []
+    threads = [threading.Thread(target=lambda: entries.append(velvet.load_entry(key))) for _ in range(30)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(entries) == 30 and all(e is entries[0] for e in entries)
+    assert len(shared_puts) == 1
+
+
+def test_encoded_bodies_count_toward_cache_bytes():
+    cache = velvet.ResponseCache(100, 4096, None)
+    first = cache.put(('first', 1, 'latest', 24), ([], 0), ttl=60)
+    cache.put(('second', 1, 'latest', 24), ([], 0), ttl=60)
+    held = cache.bytes
+    assert cache.add_encoded(first, 'data', b'x' * 1000) == b'x' * 1000
+    assert cache.bytes == held + 1000
+    cache.add_encoded(first, ('data', 'gzip'), b'y' * 4000)
+    assert cache.bytes <= 4096 and cache.peek(('first', 1, 'latest', 24)) is None
+
+
+def test_favorite_from_fetched_page_uses_upstream_copy(store, monkeypatch):
+    page = [{'id': 'up0', 'title': 'Upstream 0', 'embed': 'https://example.com/embed/up0/', 'rate': '4'}]
+    monkeypatch.setattr(velvet, 'fetch_single_page', lambda *args: (page, 1))
+    alice = login('alice')
+    assert alice.get(f'/api/data?q=intern-{store.epoch}').get_json()['videos'][0]['id'] == 'up0'
+    alice.post('/api/favorites', json={'video': {'id': 'up0', 'title': 'Sent by a client'}})
+    assert [v['title'] for v in alice.get('/api/favorites').get_json()['videos']] == ['Upstream 0']
+    if isinstance(store, velvet.MemoryStore):
+        assert 'up0' in store._catalog and not store._drafts.get('alice')
+
+
+def test_refresh_moves_etags_of_lists_holding_the_video(store):
+    alice = login('alice')
+    alice.post('/api/favorites', json={'video': {'id': 'etag9', 'title': 'Sent by a client'}})
+    alice.post('/api/history', json={'video': {'id': 'etag9', 'title': 'Sent by a client'}})
+    etags = {path: alice.get(path).headers['ETag'] for path in ('/api/favorites', '/api/history')}
+    written = store.refresh([velvet.Video('etag9', 'From upstream')])
+    if written is not None:
+        written.result()
+    for path, etag in etags.items():
+        resp = alice.get(path, headers={'If-None-Match': etag})
+        assert resp.status_code == 200
+        assert [v['title'] for v in resp.get_json()['videos']] == ['From upstream']
+    etags = {path: alice.get(path).headers['ETag'] for path in etags}
+    written = store.refresh([velvet.Video('etag9', 'From upstream')])
+    if written is not None:
+        written.result()
+    for path, etag in etags.items():
+        assert alice.get(path, headers={'If-None-Match': etag}).status_code == 304